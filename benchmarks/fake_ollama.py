@@ -0,0 +1,266 @@
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from models import Nutrition, Product
+from processor.canonical import canonical_text
+from processor.rules import CATEGORY_ALLERGENS
+
+logger = logging.getLogger(__name__)
+
+# Macronutrients of every synthesized product, and the energy that matches them
+PROTEIN, FAT, CARBOHYDRATES = 10.0, 5.0, 20.0
+CONSISTENT_ENERGY = 4 * PROTEIN + 9 * FAT + 4 * CARBOHYDRATES
+INCONSISTENT_ENERGY = CONSISTENT_ENERGY * 3
+
+class LatencyDistribution:
+    """Response latency in seconds, parsed from "fixed:S", "uniform:LOW,HIGH",
+    "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA"."""
+
+    def __init__(self, spec: str = "fixed:0"):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        self.kind = kind.strip().lower()
+        self.params = [float(param) for param in params.split(',') if param.strip()]
+        if self.kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            return self.params[0] if self.params else 0.0
+        if self.kind == 'uniform':
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == 'normal':
+            return max(rng.gauss(self.params[0], self.params[1]), 0.0)
+        return rng.lognormvariate(0.0, self.params[1]) * self.params[0]
+
+def load_recordings(path: str) -> Dict[Tuple[str, str], str]:
+    """Load successful (model, prompt) -> response pairs from a prompt trace file (TRACE_PATH)"""
+    recordings = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get('status') == 'ok' and entry.get('prompt') and entry.get('response'):
+                recordings[(entry['model'], entry['prompt'])] = entry['response']
+    logger.info(f"Loaded {len(recordings)} recorded responses from {path}")
+    return recordings
+
+def synthesize_product(ingredient: Dict[str, Any], consistent: bool) -> Dict[str, Any]:
+    """A plausible product for an ingredient; inconsistent ones fail the energy rule check"""
+    allergens = []
+    for word in canonical_text(ingredient['category']).split():
+        if word in CATEGORY_ALLERGENS:
+            allergens.append(CATEGORY_ALLERGENS[word][0])
+    energy = CONSISTENT_ENERGY if consistent else INCONSISTENT_ENERGY
+    return Product(
+        ingredientId=ingredient['id'],
+        description=f"{ingredient['name']} ({ingredient['category']})",
+        unit='g',
+        nutritions={
+            'energy': Nutrition(value=energy, unit='kcal'),
+            'protein': Nutrition(value=PROTEIN, unit='g'),
+            'fat': Nutrition(value=FAT, unit='g'),
+            'carbohydrates': Nutrition(value=CARBOHYDRATES, unit='g'),
+        },
+        allergens=allergens,
+    ).model_dump()
+
+def validate_product(product: Dict[str, Any], patch: bool) -> Dict[str, Any]:
+    """Validator answer for a product: fix its energy if it does not match the macronutrients"""
+    energy = product.get('nutritions', {}).get('energy', {}).get('value')
+    correct = energy is None or abs(energy - CONSISTENT_ENERGY) < 1
+    fixed_energy = {'value': CONSISTENT_ENERGY, 'unit': 'kcal'}
+    if patch:
+        verdict = {'ingredientId': product.get('ingredientId')}
+        if correct:
+            verdict['status'] = 'ok'
+        else:
+            verdict.update(status='patch', changes={'nutritions': {'energy': fixed_energy}})
+        return verdict
+    if correct:
+        return product
+    return {**product, 'nutritions': {**product['nutritions'], 'energy': fixed_energy}}
+
+class FakeOllama:
+    """Local HTTP server speaking enough of the Ollama API (/api/chat, /api/tags, /api/ps and model
+    loads through /api/generate) for the pipeline.
+
+    Responses are replayed from recordings when the prompt was recorded and
+    synthesized from the prompt otherwise. Each model gets its own latency
+    distribution; switch_penalty seconds are added whenever the served model
+    changes, like a host that only keeps one model loaded. failure_rate is the
+    fraction of requests answered with HTTP 500, garbage_rate the fraction
+    answered with text that is not JSON, and invalid_rate the fraction of
+    LLM1 products that fail the rule checks and need LLM2 corrections.
+    """
+
+    def __init__(self, models: List[str], latency: Optional[Dict[str, str]] = None,
+                 failure_rate: float = 0.0, garbage_rate: float = 0.0, invalid_rate: float = 0.0,
+                 switch_penalty: float = 0.0, recordings: Optional[Dict[Tuple[str, str], str]] = None,
+                 seed: int = 0):
+        self.models = models
+        self.latency = {model: LatencyDistribution(spec) for model, spec in (latency or {}).items()}
+        self.failure_rate = failure_rate
+        self.garbage_rate = garbage_rate
+        self.invalid_rate = invalid_rate
+        self.switch_penalty = switch_penalty
+        self.recordings = recordings or {}
+        self.calls: Dict[str, int] = {}
+        self.loads: Dict[str, int] = {}
+        self.failures = 0
+        self.model_switches = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded_model = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeOllama':
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send(200, {'models': [{'name': model, 'model': model} for model in fake.models]})
+                elif self.path == '/api/ps':
+                    loaded = [fake._loaded_model] if fake._loaded_model else []
+                    self._send(200, {'models': [{'name': model, 'model': model} for model in loaded]})
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path == '/api/generate' and not body.get('prompt'):
+                    load = fake.load(body['model'])
+                    self._send(200, {'model': body['model'], 'response': '', 'done': True, 'done_reason': 'load',
+                                     'load_duration': int(load * 1e9)})
+                    return
+                if self.path != '/api/chat':
+                    self._send(404, {'error': 'not found'})
+                    return
+                status, content, counts = fake.chat(body)
+                if status != 200:
+                    self._send(status, {'error': content})
+                elif body.get('stream'):
+                    self._stream(body['model'], content, counts)
+                else:
+                    self._send(200, fake.message(body['model'], content, done=True, **counts))
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client timed out
+
+            def _stream(self, model: str, content: str, counts: Dict[str, int]):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                try:
+                    for i in range(0, len(content), 16):
+                        self.wfile.write((json.dumps(fake.message(model, content[i:i + 16])) + '\n').encode())
+                    self.wfile.write((json.dumps(fake.message(model, '', done=True, **counts)) + '\n').encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client stopped reading once the JSON was complete
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @staticmethod
+    def message(model: str, content: str, done: bool = False, **fields) -> Dict[str, Any]:
+        return {'model': model, 'message': {'role': 'assistant', 'content': content}, 'done': done, **fields}
+
+    def load(self, model: str) -> float:
+        """Load a model like an empty generate request does, returning the simulated load time"""
+        with self._lock:
+            switched = self._loaded_model is not None and self._loaded_model != model
+            self._loaded_model = model
+            self.model_switches += 1 if switched else 0
+            self.loads[model] = self.loads.get(model, 0) + 1
+        load = self.switch_penalty if switched else 0.0
+        time.sleep(load)
+        return load
+
+    def chat(self, request: Dict[str, Any]) -> Tuple[int, str, Dict[str, int]]:
+        """Answer a chat request, returning (HTTP status, content, Ollama counters)"""
+        model = request.get('model')
+        messages = request.get('messages', [])
+        system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        prompt = messages[-1]['content'] if messages else ''
+
+        with self._lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            switched = self._loaded_model is not None and self._loaded_model != model
+            self._loaded_model = model
+            self.model_switches += 1 if switched else 0
+            delay = self.latency[model].sample(self._rng) if model in self.latency else 0.0
+            roll = self._rng.random()
+            invalid_rolls = [self._rng.random() for _ in range(max(prompt.count('"id"'), 1))]
+
+        load = self.switch_penalty if switched else 0.0
+        time.sleep(delay + load)
+
+        if roll < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            return 500, 'simulated failure', {}
+        if roll < self.failure_rate + self.garbage_rate:
+            content = 'Sorry, I cannot help with that.'
+        elif (model, prompt) in self.recordings:
+            content = self.recordings[(model, prompt)]
+        else:
+            content = self._synthesize(system, prompt, invalid_rolls)
+
+        counts = {
+            'prompt_eval_count': (len(system) + len(prompt)) // 4,
+            'eval_count': len(content) // 4,
+            'load_duration': int(load * 1e9),
+            'prompt_eval_duration': int(delay * 0.2 * 1e9),
+            'eval_duration': int(delay * 0.8 * 1e9),
+            'total_duration': int((delay + load) * 1e9),
+        }
+        return 200, content, counts
+
+    def _synthesize(self, system: str, prompt: str, invalid_rolls: List[float]) -> str:
+        patch = '"status": "patch"' in system
+        label, _, payload = prompt.partition(': ')
+        if label == 'Ingredient':
+            return json.dumps(synthesize_product(json.loads(payload), invalid_rolls[0] >= self.invalid_rate))
+        if label == 'Ingredients':
+            return json.dumps([
+                synthesize_product(ingredient, roll >= self.invalid_rate)
+                for ingredient, roll in zip(json.loads(payload), invalid_rolls)
+            ])
+        if label == 'Items':
+            return json.dumps([validate_product(item['product'], patch) for item in json.loads(payload)])
+        if label == 'Original ingredient':
+            product_line = next(line for line in prompt.splitlines() if line.startswith('Product JSON to validate: '))
+            product = json.loads(product_line.partition(': ')[2])
+            return json.dumps(validate_product(product, patch))
+        return '{}'
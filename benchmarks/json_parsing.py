@@ -0,0 +1,98 @@
+"""Microbenchmark of response parsing: the previous character walk + json.loads + Product(**data)
+against single-pass decoding + Product.model_validate.
+
+Usage: python -m benchmarks.json_parsing [--replay TRACE] [--repeat N]
+"""
+import argparse
+import gzip
+import json
+import time
+from typing import Callable, List, Optional
+from benchmarks.fake_ollama import synthesize_product
+from benchmarks.scenarios import Scenario
+from llm.json_scan import decode_json, orjson
+from models import Product
+
+def legacy_extract_json(text: str, prefer_array: bool = False) -> Optional[str]:
+    """The extractor OllamaClient used before the single-pass scanner, kept for comparison"""
+    text = text.strip()
+    start_chars = ['{', '[']
+    end_chars = ['}', ']']
+    if prefer_array:
+        start_chars.reverse()
+        end_chars.reverse()
+    for start_char, end_char in zip(start_chars, end_chars):
+        start_idx = text.find(start_char)
+        if start_idx != -1:
+            bracket_count = 0
+            for i, char in enumerate(text[start_idx:], start_idx):
+                if char == start_char:
+                    bracket_count += 1
+                elif char == end_char:
+                    bracket_count -= 1
+                    if bracket_count == 0:
+                        return text[start_idx:i+1]
+    try:
+        json.loads(text)
+        return text
+    except:
+        pass
+    return None
+
+def legacy_parse(text: str, array: bool):
+    json_str = legacy_extract_json(text, prefer_array=array)
+    data = json.loads(json_str)
+    return [Product(**item) for item in data] if array else Product(**data)
+
+def single_pass_parse(text: str, array: bool):
+    data = decode_json(text, '[{' if array else '{')
+    return [Product.model_validate(item) for item in data] if array else Product.model_validate(data)
+
+def sample_responses() -> List[str]:
+    """Single products (bare, with prose, code-fenced) and packed arrays of ten"""
+    ingredients = [ingredient.model_dump() for ingredient in Scenario(name='parse', ingredients=100).build_ingredients()]
+    responses = []
+    for ingredient in ingredients:
+        product = json.dumps(synthesize_product(ingredient, True), indent=2)
+        responses += [product, f"Here is the product JSON:\n{product}\nLet me know if you need more.",
+                      f"```json\n{product}\n```"]
+    for i in range(0, len(ingredients), 10):
+        responses.append(json.dumps([synthesize_product(ingredient, True) for ingredient in ingredients[i:i + 10]]))
+    return responses
+
+def recorded_responses(path: str) -> List[str]:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [entry['response'] for entry in map(json.loads, f)
+                if entry.get('status') == 'ok' and entry.get('response')]
+
+def measure(parse: Callable, responses: List[str], repeat: int) -> float:
+    """Mean microseconds per response, skipping responses the parser rejects"""
+    usable = []
+    for text in responses:
+        array = text.lstrip('`json \n').startswith('[')
+        try:
+            parse(text, array)
+            usable.append((text, array))
+        except Exception:
+            pass
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, array in usable:
+            parse(text, array)
+    return (time.perf_counter() - started) / (repeat * max(len(usable), 1)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM response parsing")
+    parser.add_argument('--replay', metavar='TRACE', help="Parse responses recorded in a prompt trace file")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    responses = recorded_responses(args.replay) if args.replay else sample_responses()
+    legacy = measure(legacy_parse, responses, args.repeat)
+    single_pass = measure(single_pass_parse, responses, args.repeat)
+    print(f"{len(responses)} responses, JSON backend: {'orjson' if orjson else 'json'}")
+    print(f"legacy walk + json.loads + Product(**data): {legacy:8.1f} µs/response")
+    print(f"single-pass decode + model_validate:        {single_pass:8.1f} µs/response ({legacy / single_pass:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Offline pipeline benchmarks against a fake Ollama and in-memory databases.
+
+Usage: python -m benchmarks.run [SCENARIO ...] [--mode batch|all] [--replay TRACE] [--json PATH]
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from config import Config
+from benchmarks.fake_ollama import FakeOllama, load_recordings, synthesize_product
+from benchmarks.scenarios import SCENARIOS, Scenario
+from benchmarks.stand_ins import InMemoryProductSink, SQLiteIngredientSource
+from llm.ollama_client import OllamaClient
+from models import Product
+from processor.food_processor import process_all, process_batch
+from telemetry.metrics import metrics
+from telemetry.prompt_trace import prompt_trace
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def config_overrides(settings: Dict[str, Any]):
+    """Temporarily override Config attributes"""
+    previous = {name: getattr(Config, name) for name in settings}
+    for name, value in settings.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(Config, name, value)
+
+def run_scenario(scenario: Scenario, mode: str = 'batch', recordings: Optional[Dict] = None) -> Dict[str, Any]:
+    """Run one scenario through process_batch or process_all and measure it"""
+    fake = FakeOllama(
+        [Config.LLM1_MODEL, Config.LLM2_MODEL],
+        latency={Config.LLM1_MODEL: scenario.llm1_latency, Config.LLM2_MODEL: scenario.llm2_latency},
+        failure_rate=scenario.failure_rate,
+        garbage_rate=scenario.garbage_rate,
+        invalid_rate=scenario.invalid_rate,
+        switch_penalty=scenario.switch_penalty,
+        recordings=recordings,
+        seed=scenario.seed,
+    ).start()
+
+    ingredients = scenario.build_ingredients()
+    source = SQLiteIngredientSource(ingredients)
+    sink = InMemoryProductSink(write_latency=scenario.write_latency)
+    rng = random.Random(scenario.seed)
+    existing = [ingredient for ingredient in ingredients if rng.random() < scenario.existing_ratio]
+    sink.upsert_products([Product(**synthesize_product(ingredient.model_dump(), True)) for ingredient in existing])
+
+    settings = {
+        'OLLAMA_HOSTS': [fake.url],
+        'LLM_CACHE_PATH': '',
+        'METRICS_PATH': '',
+        'METRICS_TIMELINE_PATH': '',
+        'BATCH_SIZE': len(ingredients),
+        **scenario.settings,
+    }
+    trace_path, prompt_trace.path = prompt_trace.path, ''
+    try:
+        with tempfile.TemporaryDirectory() as run_dir, config_overrides({**settings, 'RUN_DIR': run_dir}):
+            metrics.reset()
+            llm_client = OllamaClient()
+            tracemalloc.start()
+            started = time.perf_counter()
+            if mode == 'all':
+                process_all(pg_client=source, mongo_client=sink, llm_client=llm_client)
+            else:
+                process_batch(pg_client=source, mongo_client=sink, llm_client=llm_client)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        prompt_trace.path = trace_path
+        fake.stop()
+
+    calls = sum(fake.calls.values())
+    return {
+        'scenario': scenario.name,
+        'mode': mode,
+        'ingredients': len(ingredients),
+        'products': len(sink.products),
+        'seconds': round(elapsed, 3),
+        'ingredients_per_second': round(len(ingredients) / elapsed, 2),
+        'llm1_calls': fake.calls.get(Config.LLM1_MODEL, 0),
+        'llm2_calls': fake.calls.get(Config.LLM2_MODEL, 0),
+        'calls_per_ingredient': round(calls / len(ingredients), 3),
+        'http_failures': fake.failures,
+        'model_switches': fake.model_switches,
+        'peak_memory_mb': round(peak / 1024 / 1024, 2),
+    }
+
+def print_results(results: List[Dict[str, Any]]):
+    columns = ['scenario', 'mode', 'ingredients', 'products', 'seconds', 'ingredients_per_second',
+               'calls_per_ingredient', 'http_failures', 'model_switches', 'peak_memory_mb']
+    widths = {column: max(len(column), *(len(str(result[column])) for result in results)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(widths[column]) for column in columns))
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline against a fake Ollama")
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--mode', choices=['batch', 'all'], default='batch',
+                        help="Run through process_batch or the chunked process_all (default: batch)")
+    parser.add_argument('--replay', metavar='TRACE',
+                        help="Replay responses recorded in a prompt trace file (record with TRACE_SAMPLE_RATE=1)")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline logs")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    recordings = load_recordings(args.replay) if args.replay else None
+
+    results = []
+    for name in args.scenarios or list(SCENARIOS):
+        results.append(run_scenario(SCENARIOS[name], args.mode, recordings))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
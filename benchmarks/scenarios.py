@@ -0,0 +1,54 @@
+import random
+from typing import Any, Dict, List
+from pydantic import BaseModel
+from models import Ingredient
+
+# Names and categories the synthetic ingredients are drawn from
+NAMES = ['apple', 'banana', 'carrot', 'cheddar', 'salmon', 'almond', 'rice', 'lentil', 'spinach', 'yogurt',
+         'oat', 'tomato', 'egg', 'shrimp', 'walnut', 'potato', 'chicken', 'tofu', 'basil', 'honey']
+CATEGORIES = ['Fruit', 'Vegetable', 'Dairy', 'Fish', 'Nut', 'Grain', 'Legume', 'Egg', 'Seafood', 'Meat']
+
+class Scenario(BaseModel):
+    """A benchmark workload: the ingredient table, the fake Ollama's behaviour and Config overrides"""
+    name: str
+    ingredients: int = 200
+    duplicate_ratio: float = 0.0  # Fraction of ingredients that repeat an earlier one with different spelling
+    existing_ratio: float = 0.0  # Fraction of ingredients that already have a product in the sink
+    failure_rate: float = 0.0  # Fraction of model requests answered with HTTP 500
+    garbage_rate: float = 0.0  # Fraction of model requests answered with text that is not JSON
+    invalid_rate: float = 0.3  # Fraction of LLM1 products that fail the rule checks
+    llm1_latency: str = "lognormal:0.02,0.3"
+    llm2_latency: str = "lognormal:0.02,0.3"
+    switch_penalty: float = 0.0  # Seconds added when the fake host swaps models
+    write_latency: float = 0.0  # Seconds per bulk write to the sink
+    settings: Dict[str, Any] = {}  # Config attributes overridden while the scenario runs
+    seed: int = 0
+
+    def build_ingredients(self) -> List[Ingredient]:
+        """Generate the ingredient table, with duplicates spelled differently from their originals"""
+        rng = random.Random(self.seed)
+        ingredients: List[Ingredient] = []
+        for ingredient_id in range(1, self.ingredients + 1):
+            if ingredients and rng.random() < self.duplicate_ratio:
+                original = rng.choice(ingredients)
+                ingredients.append(Ingredient(id=ingredient_id, name=f"  {original.name.upper()} ",
+                                              category=original.category.lower()))
+            else:
+                name = f"{rng.choice(NAMES)} {ingredient_id}"
+                ingredients.append(Ingredient(id=ingredient_id, name=name, category=rng.choice(CATEGORIES)))
+        return ingredients
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    Scenario(name='baseline'),
+    Scenario(name='duplicates', duplicate_ratio=0.5),
+    Scenario(name='resumed', existing_ratio=0.5),
+    Scenario(name='flaky', failure_rate=0.05, garbage_rate=0.05),
+    Scenario(name='swap-interleaved', switch_penalty=0.05, settings={'SCHEDULER': 'interleaved'}),
+    Scenario(name='swap-phased', switch_penalty=0.05, settings={'SCHEDULER': 'phased'}),
+    Scenario(name='concurrent', settings={'WORKERS': 8, 'LLM1_MAX_IN_FLIGHT': 4, 'LLM2_MAX_IN_FLIGHT': 4}),
+    Scenario(name='packed', settings={'LLM1_PACK_SIZE': 5, 'LLM2_PACK_SIZE': 5}),
+    Scenario(name='patch', settings={'LLM2_PATCH_MODE': True}),
+    Scenario(name='tail', llm1_latency="lognormal:0.02,1.5", llm2_latency="lognormal:0.02,1.5"),
+    Scenario(name='tail-hedged', llm1_latency="lognormal:0.02,1.5", llm2_latency="lognormal:0.02,1.5",
+             settings={'LLM_HEDGE': True, 'LLM_HEDGE_MIN_DELAY': 0.0}),
+]}
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+from models import Ingredient, Product, Provenance
+from telemetry.metrics import metrics
+
+class SQLiteIngredientSource:
+    """In-memory SQLite stand-in for PostgresClient"""
+
+    def __init__(self, ingredients: List[Ingredient]):
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.connection.execute("CREATE TABLE ingredient (id INTEGER PRIMARY KEY, name TEXT NOT NULL, category TEXT NOT NULL)")
+        self.connection.executemany(
+            "INSERT INTO ingredient (id, name, category) VALUES (?, ?, ?)",
+            [(ingredient.id, ingredient.name, ingredient.category) for ingredient in ingredients]
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def _ingredients(rows) -> List[Ingredient]:
+        return [Ingredient(id=row[0], name=row[1], category=row[2]) for row in rows]
+
+    def get_ingredients(self, limit: Optional[int] = None, offset: int = 0) -> List[Ingredient]:
+        with metrics.timer('pg_fetch'):
+            rows = self.connection.execute(
+                "SELECT id, name, category FROM ingredient ORDER BY id LIMIT ? OFFSET ?",
+                (limit if limit else -1, offset)
+            ).fetchall()
+        return self._ingredients(rows)
+
+    def get_ingredients_by_ids(self, ingredient_ids: List[int]) -> List[Ingredient]:
+        with metrics.timer('pg_fetch'):
+            rows = self.connection.execute(
+                f"SELECT id, name, category FROM ingredient WHERE id IN ({','.join('?' * len(ingredient_ids))}) ORDER BY id",
+                list(ingredient_ids)
+            ).fetchall() if ingredient_ids else []
+        return self._ingredients(rows)
+
+    def iter_ingredients(self, chunk_size: int, start_after: int = 0,
+                         end_id: Optional[int] = None) -> Iterator[List[Ingredient]]:
+        last_id = start_after
+        while True:
+            with metrics.timer('pg_fetch'):
+                rows = self.connection.execute(
+                    "SELECT id, name, category FROM ingredient WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                    (last_id, end_id if end_id is not None else 2 ** 62, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            chunk = self._ingredients(rows)
+            last_id = chunk[-1].id
+            yield chunk
+
+    def close(self):
+        self.connection.close()
+
+class InMemoryProductSink:
+    """In-memory stand-in for MongoDBClient, with an optional delay per bulk write"""
+
+    def __init__(self, write_latency: float = 0.0):
+        self.products: Dict[int, Dict[str, Any]] = {}
+        self.write_latency = write_latency
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def existing_ingredient_ids(self, ingredient_ids: Iterable[int]) -> Set[int]:
+        with metrics.timer('existence_check'):
+            with self._lock:
+                return {ingredient_id for ingredient_id in ingredient_ids if ingredient_id in self.products}
+
+    def upsert_products(self, products: List[Product],
+                        provenances: Optional[Sequence[Optional[Provenance]]] = None) -> int:
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            for product, provenance in zip(products, provenances or [None] * len(products)):
+                self.products[product.ingredientId] = product.model_dump()
+                if provenance:
+                    self.products[product.ingredientId]['provenance'] = provenance.model_dump()
+            self.writes += 1
+        return len(products)
+
+    def reenrichment_candidates(self, llm1_model: str, llm2_model: str, prompt_version: str,
+                                limit: int = 0) -> List[int]:
+        with self._lock:
+            provenances = {ingredient_id: product.get('provenance') for ingredient_id, product in self.products.items()}
+        unconverged = sorted((p['processedAt'], i) for i, p in provenances.items() if p and p['status'] == 'not_converged')
+        unstamped = [i for i, p in provenances.items() if not p]
+        stale = [i for i, p in provenances.items() if p and p['status'] != 'not_converged' and (
+            p['promptVersion'] != prompt_version or p['llm1Model'] != llm1_model
+            or p['llm2Model'] not in (llm2_model, None))]
+        ingredient_ids = [i for _, i in unconverged] + unstamped + stale
+        return ingredient_ids[:limit] if limit else ingredient_ids
+
+    def insert_products(self, products: List[Product]) -> List[str]:
+        self.upsert_products(products)
+        return [str(product.ingredientId) for product in products]
+
+    def get_product_by_ingredient_id(self, ingredient_id: int) -> Dict[str, Any]:
+        with self._lock:
+            return self.products.get(ingredient_id)
+
+    def close(self):
+        pass
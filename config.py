@@ -16,12 +16,85 @@ class Config:
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
     MONGO_DB = os.getenv('MONGO_DB', 'food_database')
     MONGO_COLLECTION = os.getenv('MONGO_COLLECTION', 'products')
+    MONGO_WRITE_CONCERN = os.getenv('MONGO_WRITE_CONCERN', '1')  # "w" option: a node count or "majority"
+    MONGO_WRITE_JOURNAL = os.getenv('MONGO_WRITE_JOURNAL', 'false').lower() == 'true'
+    WRITE_FLUSH_SIZE = int(os.getenv('WRITE_FLUSH_SIZE', '50'))  # Flush buffered products every N products...
+    WRITE_FLUSH_INTERVAL = float(os.getenv('WRITE_FLUSH_INTERVAL', '30'))  # ...or every T seconds
     
     # Ollama Configuration
     OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+    # Comma-separated list of hosts to load-balance over (defaults to OLLAMA_HOST)
+    OLLAMA_HOSTS = [host.strip() for host in os.getenv('OLLAMA_HOSTS', OLLAMA_HOST).split(',') if host.strip()]
+    OLLAMA_MAX_FAILURES = int(os.getenv('OLLAMA_MAX_FAILURES', '3'))  # Consecutive failures before a host is ejected
+    OLLAMA_EJECT_SECONDS = float(os.getenv('OLLAMA_EJECT_SECONDS', '30'))  # Delay before an ejected host is re-probed
+    OLLAMA_PROBE_TIMEOUT_SECONDS = float(os.getenv('OLLAMA_PROBE_TIMEOUT_SECONDS', '5'))  # Deadline of a host health check
     LLM1_MODEL = os.getenv('LLM1_MODEL', 'llama3.1:8b')  # Primary transformer model
     LLM2_MODEL = os.getenv('LLM2_MODEL', 'mistral:7b')   # Validator/corrector model
+    OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # How long Ollama keeps models and their KV cache loaded
+    OLLAMA_WARMUP = os.getenv('OLLAMA_WARMUP', 'true').lower() == 'true'  # Load both models on every host at startup
+    OLLAMA_HEARTBEAT_SECONDS = float(os.getenv('OLLAMA_HEARTBEAT_SECONDS', '300'))  # Keep-alive refresh interval (0 = off)
+    LLM_OUTPUT_FORMAT = os.getenv('LLM_OUTPUT_FORMAT', '')  # '' (free text), 'json' or 'schema' (Product JSON schema)
+    LLM_STREAM = os.getenv('LLM_STREAM', 'false').lower() == 'true'  # Stream and stop once the JSON is complete
+    LLM2_PATCH_MODE = os.getenv('LLM2_PATCH_MODE', 'false').lower() == 'true'  # LLM2 returns "ok" or a field-level patch
+
+    # LLM Request Reliability Configuration
+    LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '120'))  # Deadline of one model request (0 = none)
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))  # Retries after a failed attempt (0 = single attempt)
+    LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))  # Retry n waits a random 0..BASE*2^n seconds...
+    LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '10'))  # ...capped at this
+    LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))  # Consecutive failures that open a model's circuit (0 = off)
+    LLM_BREAKER_SECONDS = float(os.getenv('LLM_BREAKER_SECONDS', '30'))  # How long an open circuit rejects requests
+    LLM_HEDGE = os.getenv('LLM_HEDGE', 'false').lower() == 'true'  # Duplicate requests slower than the model's p95
+    LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.5'))  # Never hedge before this many seconds
+
+    # LLM Response Cache Configuration
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite')  # Empty disables the cache
+    LLM_CACHE_MAX_MB = int(os.getenv('LLM_CACHE_MAX_MB', '512'))
+    LLM_CACHE_TTL_HOURS = float(os.getenv('LLM_CACHE_TTL_HOURS', '720'))  # 0 = never expire
     
     # Processing Configuration
     MAX_ITERATIONS = int(os.getenv('MAX_ITERATIONS', '3'))
+    CONVERGENCE_POLICY = os.getenv('CONVERGENCE_POLICY', 'tolerant')  # exact, tolerant or important
+    CONVERGENCE_REL_TOL = float(os.getenv('CONVERGENCE_REL_TOL', '0.01'))
+    CONVERGENCE_ABS_TOL = float(os.getenv('CONVERGENCE_ABS_TOL', '0.1'))
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', '10'))
+    CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '100'))  # Rows per page when streaming the whole table
+    DEDUPLICATE = os.getenv('DEDUPLICATE', 'true').lower() == 'true'  # Enrich identical names once per run
+    DEDUPLICATE_MAX_ENTRIES = int(os.getenv('DEDUPLICATE_MAX_ENTRIES', '10000'))  # Products kept for reuse by later chunks
+    CLAIMS_TABLE = os.getenv('CLAIMS_TABLE', 'ingredient_claims')  # Work queue shared by --worker processes
+    CLAIM_RANGE_SIZE = int(os.getenv('CLAIM_RANGE_SIZE', '500'))  # Ingredient ids per claimed range
+    LEASE_SECONDS = int(os.getenv('LEASE_SECONDS', '600'))  # Claims of dead workers expire after this
+    HEARTBEAT_SECONDS = int(os.getenv('HEARTBEAT_SECONDS', '60'))
+    CDC_CHANNEL = os.getenv('CDC_CHANNEL', 'ingredient_changes')  # LISTEN/NOTIFY channel used by --daemon
+    CDC_STATE_TABLE = os.getenv('CDC_STATE_TABLE', 'ingredient_cdc_state')  # updated_at watermark of --daemon
+    CDC_BATCH_SIZE = int(os.getenv('CDC_BATCH_SIZE', '50'))  # Max changed ingredients per micro-batch
+    CDC_BATCH_WINDOW = float(os.getenv('CDC_BATCH_WINDOW', '1.0'))  # Seconds to coalesce a burst of changes
+    CDC_POLL_SECONDS = float(os.getenv('CDC_POLL_SECONDS', '60'))  # Idle time before catching up from the watermark
+    REENRICH_LIMIT = int(os.getenv('REENRICH_LIMIT', '0'))  # Max products re-enriched by --reenrich (0 = all)
+    RUN_DIR = os.getenv('RUN_DIR', 'runs')  # Run journals used by --resume
+    JOURNAL_SYNC_EVERY = int(os.getenv('JOURNAL_SYNC_EVERY', '50'))  # Journal updates per fsync
+    PRE_VALIDATION = os.getenv('PRE_VALIDATION', 'true').lower() == 'true'  # Skip LLM2 for products passing rule checks
+    RULES_ENERGY_TOLERANCE = float(os.getenv('RULES_ENERGY_TOLERANCE', '0.15'))  # Relative Atwater energy tolerance
+
+    # Concurrency Configuration
+    WORKERS = int(os.getenv('WORKERS', '1'))  # Ingredients processed in parallel (1 = sequential)
+    LLM1_MAX_IN_FLIGHT = int(os.getenv('LLM1_MAX_IN_FLIGHT', '2'))  # Concurrent requests to LLM1_MODEL
+    LLM2_MAX_IN_FLIGHT = int(os.getenv('LLM2_MAX_IN_FLIGHT', '2'))  # Concurrent requests to LLM2_MODEL
+    # When LLM1_MODEL == LLM2_MODEL both roles share one limit, the smaller of the two
+
+    # Prompt Packing Configuration (ingredients per request, 1 = one request per ingredient)
+    LLM1_PACK_SIZE = int(os.getenv('LLM1_PACK_SIZE', '1'))
+    LLM2_PACK_SIZE = int(os.getenv('LLM2_PACK_SIZE', '1'))
+
+    # Scheduling Configuration
+    SCHEDULER = os.getenv('SCHEDULER', 'phased').lower()  # phased (one model per phase) or interleaved (per ingredient)
+    PHASE_CHUNK_SIZE = int(os.getenv('PHASE_CHUNK_SIZE', '0'))  # Ingredients per phase-scheduled chunk (0 = whole chunk)
+
+    # Prompt Trace Configuration (full prompts and responses, kept out of the normal logs)
+    TRACE_PATH = os.getenv('TRACE_PATH', 'prompt_traces.jsonl.gz')  # Empty disables tracing
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))  # Fraction of successful calls traced
+    TRACE_FAILURES = os.getenv('TRACE_FAILURES', 'true').lower() == 'true'  # Always trace failed calls
+
+    # Metrics Configuration (empty paths disable the output)
+    METRICS_PATH = os.getenv('METRICS_PATH', '')  # Prometheus text file, or JSON when the path ends in .json
+    METRICS_TIMELINE_PATH = os.getenv('METRICS_TIMELINE_PATH', '')  # Chrome-trace timeline of stages and ingredients
@@ -0,0 +1,202 @@
+import logging
+import select
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+from config import Config
+from database.postgres_client import PostgresClient
+from models import Ingredient
+from telemetry.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class ChangeFeed:
+    """Inserted and renamed ingredients, delivered through LISTEN/NOTIFY with an updated_at watermark.
+
+    Triggers stamp updated_at on every insert or change of name/category and
+    notify CDC_CHANNEL with the row id. Notifications are coalesced into
+    micro-batches. The (updated_at, id) of the newest processed row is stored
+    in CDC_STATE_TABLE, so changes made while the daemon was down are caught
+    up from the watermark at startup and on every idle poll.
+
+    Notified ids are processed in id order, not (updated_at, id) order, so the
+    watermark only moves past fetched rows once no notified id is left pending;
+    otherwise a pending row older than the batch could fall behind it.
+    """
+
+    def __init__(self, channel: Optional[str] = None, batch_size: Optional[int] = None,
+                 batch_window: Optional[float] = None, pg_client: Optional[PostgresClient] = None):
+        self.channel = channel or Config.CDC_CHANNEL
+        self.batch_size = batch_size or Config.CDC_BATCH_SIZE
+        self.batch_window = batch_window if batch_window is not None else Config.CDC_BATCH_WINDOW
+        self.table = Config.POSTGRES_TABLE
+        self.state_table = Config.CDC_STATE_TABLE
+
+        # A pg_client that is passed in stays open when the feed is closed
+        self._owns_pg_client = pg_client is None
+        self.pg_client = pg_client or PostgresClient()
+        # Notifications are only delivered outside of transactions
+        self._listen_client = PostgresClient()
+        self._listen_client.connection.autocommit = True
+        self._pending_ids: Set[int] = set()
+        self.watermark: Optional[Tuple] = None
+        self._next_watermark: Optional[Tuple] = None
+        self._fetched_max: Optional[Tuple] = None  # Newest position fetched by notification
+
+    def _execute(self, query: str, params: tuple = (), fetch: bool = False):
+        """Run a statement in its own transaction"""
+        connection = self.pg_client.connection
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall() if fetch else None
+            connection.commit()
+            return rows
+        except Exception:
+            connection.rollback()
+            raise
+
+    def ensure_triggers(self):
+        """Add the updated_at column, its index, the triggers and the watermark table if missing"""
+        table = self.table
+        self._execute(
+            f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+            CREATE INDEX IF NOT EXISTS {table}_updated_at_idx ON {table} (updated_at, id);
+
+            CREATE OR REPLACE FUNCTION {table}_touch() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at := now();
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION {table}_notify_change() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{self.channel}', NEW.id::text);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS {table}_touch ON {table};
+            CREATE TRIGGER {table}_touch BEFORE INSERT OR UPDATE OF name, category ON {table}
+                FOR EACH ROW EXECUTE FUNCTION {table}_touch();
+
+            DROP TRIGGER IF EXISTS {table}_notify_change ON {table};
+            CREATE TRIGGER {table}_notify_change AFTER INSERT OR UPDATE OF name, category ON {table}
+                FOR EACH ROW EXECUTE FUNCTION {table}_notify_change();
+
+            CREATE TABLE IF NOT EXISTS {self.state_table} (
+                channel TEXT PRIMARY KEY,
+                updated_at TIMESTAMPTZ NOT NULL,
+                last_id BIGINT NOT NULL
+            );
+            """
+        )
+
+    def start(self):
+        """Install the triggers, subscribe to the channel and load the watermark"""
+        self.ensure_triggers()
+        with self._listen_client.connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+
+        rows = self._execute(
+            f"SELECT updated_at, last_id FROM {self.state_table} WHERE channel = %s", (self.channel,), fetch=True
+        )
+        if rows:
+            self.watermark = (rows[0]['updated_at'], rows[0]['last_id'])
+            logger.info(f"Change feed {self.channel} resuming after {self.watermark[0]} (id {self.watermark[1]})")
+        else:
+            # First start: only follow new changes; existing rows are backfilled with --all
+            rows = self._execute(
+                f"SELECT updated_at, id FROM {self.table} ORDER BY updated_at DESC, id DESC LIMIT 1", fetch=True
+            )
+            if rows:
+                self._next_watermark = (rows[0]['updated_at'], rows[0]['id'])
+                self.commit()
+            logger.info(f"Change feed {self.channel} started; run with --all once to backfill existing ingredients")
+
+    def wait(self, timeout: float) -> Set[int]:
+        """Wait up to timeout seconds for changes, then coalesce them for batch_window seconds.
+
+        Returns the changed ingredient ids, at most batch_size of them; the rest
+        are kept for the next call.
+        """
+        connection = self._listen_client.connection
+        deadline = None
+        end = time.monotonic() + timeout
+        while len(self._pending_ids) < self.batch_size:
+            now = time.monotonic()
+            if self._pending_ids and deadline is None:
+                deadline = now + self.batch_window
+            remaining = (deadline if deadline is not None else end) - now
+            if remaining <= 0:
+                break
+            if select.select([connection], [], [], remaining) != ([], [], []):
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    try:
+                        self._pending_ids.add(int(notify.payload))
+                    except ValueError:
+                        logger.warning(f"Ignoring notification with payload {notify.payload!r}")
+
+        ids = set(sorted(self._pending_ids)[:self.batch_size])
+        self._pending_ids -= ids
+        return ids
+
+    def _load(self, query: str, params: tuple) -> Tuple[List[Ingredient], Optional[Tuple]]:
+        """Run a query, returning the ingredients and the newest (updated_at, id) among them"""
+        with metrics.timer('pg_fetch'):
+            rows = self._execute(query, params, fetch=True)
+        newest = max(((row['updated_at'], row['id']) for row in rows), default=None)
+        return [Ingredient(id=row['id'], name=row['name'], category=row['category']) for row in rows], newest
+
+    def _advance(self, position: Optional[Tuple]):
+        if position is not None and (self._next_watermark is None or position > self._next_watermark):
+            self._next_watermark = position
+
+    def fetch(self, ids: Iterable[int]) -> List[Ingredient]:
+        """Load the current version of changed ingredients; deleted rows are dropped"""
+        ingredients, newest = self._load(
+            f"SELECT id, name, category, updated_at FROM {self.table} WHERE id = ANY(%s) ORDER BY id",
+            (sorted(ids),)
+        )
+        if newest is not None and (self._fetched_max is None or newest > self._fetched_max):
+            self._fetched_max = newest
+        # Every notified id up to the newest fetched row is handled once none is pending
+        if not self._pending_ids:
+            self._advance(self._fetched_max)
+        return ingredients
+
+    def poll(self) -> List[Ingredient]:
+        """Load up to batch_size ingredients changed after the watermark, oldest first"""
+        if self.watermark is None:
+            ingredients, newest = self._load(
+                f"SELECT id, name, category, updated_at FROM {self.table} ORDER BY updated_at, id LIMIT %s",
+                (self.batch_size,)
+            )
+        else:
+            ingredients, newest = self._load(
+                f"SELECT id, name, category, updated_at FROM {self.table} "
+                "WHERE (updated_at, id) > (%s, %s) ORDER BY updated_at, id LIMIT %s",
+                (*self.watermark, self.batch_size)
+            )
+        # Rows are read in watermark order, so everything up to the newest one has been loaded
+        self._advance(newest)
+        return ingredients
+
+    def commit(self):
+        """Persist the watermark once the loaded ingredients' products are durable"""
+        if self._next_watermark is None or self._next_watermark == self.watermark:
+            return
+        self._execute(
+            f"INSERT INTO {self.state_table} (channel, updated_at, last_id) VALUES (%s, %s, %s) "
+            "ON CONFLICT (channel) DO UPDATE SET updated_at = EXCLUDED.updated_at, last_id = EXCLUDED.last_id",
+            (self.channel, *self._next_watermark)
+        )
+        self.watermark = self._next_watermark
+
+    def close(self):
+        self._listen_client.close()
+        if self._owns_pg_client:
+            self.pg_client.close()
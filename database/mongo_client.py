@@ -1,8 +1,11 @@
-from pymongo import MongoClient
-from typing import List, Dict, Any
+from pymongo import MongoClient, ASCENDING, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
+from typing import Iterable, List, Dict, Any, Optional, Sequence, Set
 import logging
-from models import Product
+from models import Product, Provenance
 from config import Config
+from telemetry.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +14,40 @@ class MongoDBClient:
         self.client = MongoClient(Config.MONGO_URI)
         self.db = self.client[Config.MONGO_DB]
         self.collection = self.db[Config.MONGO_COLLECTION]
+        self.write_concern = self._build_write_concern()
         logger.info("Connected to MongoDB database")
+        self.ensure_indexes()
+
+    @staticmethod
+    def _build_write_concern() -> WriteConcern:
+        """Build the write concern used for bulk upserts from the configuration"""
+        w = Config.MONGO_WRITE_CONCERN
+        return WriteConcern(w=int(w) if w.isdigit() else w, j=Config.MONGO_WRITE_JOURNAL)
+
+    def ensure_indexes(self):
+        """Ensure a unique index on ingredientId so overlapping runs cannot insert duplicates"""
+        try:
+            self.collection.create_index([("ingredientId", ASCENDING)], unique=True, name="ingredientId_unique")
+        except PyMongoError as e:
+            # Typically caused by duplicates left over from earlier runs
+            logger.error(f"Failed to create unique index on ingredientId: {e}")
+        try:
+            # Used by reenrichment_candidates; documents without provenance index as null
+            self.collection.create_index([("provenance.status", ASCENDING), ("provenance.processedAt", ASCENDING)],
+                                         name="provenance_status")
+            self.collection.create_index([("provenance.promptVersion", ASCENDING)], name="provenance_prompt")
+            self.collection.create_index([("provenance.llm1Model", ASCENDING)], name="provenance_llm1")
+            self.collection.create_index([("provenance.llm2Model", ASCENDING)], name="provenance_llm2")
+        except PyMongoError as e:
+            logger.error(f"Failed to create provenance indexes: {e}")
+
+    @staticmethod
+    def _document(product: Product, provenance: Optional[Provenance] = None) -> Dict[str, Any]:
+        """MongoDB document for a product, stamped with its provenance when known"""
+        document = product.model_dump()
+        if provenance:
+            document["provenance"] = provenance.model_dump()
+        return document
     
     def insert_product(self, product: Product) -> bool:
         """Insert a single product into MongoDB"""
@@ -30,18 +66,96 @@ class MongoDBClient:
         
         try:
             product_dicts = [product.model_dump() for product in products]
-            result = self.collection.insert_many(product_dicts)
+            result = self.collection.insert_many(product_dicts, ordered=False)
             inserted_count = len(result.inserted_ids)
             logger.info(f"Inserted {inserted_count} products into MongoDB")
             return inserted_count
+        except BulkWriteError as e:
+            # Duplicates rejected by the unique index do not stop the rest of the batch
+            inserted_count = e.details.get('nInserted', 0)
+            duplicates = sum(1 for error in e.details.get('writeErrors', []) if error.get('code') == 11000)
+            logger.warning(f"Inserted {inserted_count} products into MongoDB, skipped {duplicates} duplicates")
+            return inserted_count
         except Exception as e:
             logger.error(f"Failed to insert products: {e}")
             return 0
     
+    def upsert_products(self, products: List[Product],
+                        provenances: Optional[Sequence[Optional[Provenance]]] = None) -> int:
+        """Upsert products keyed on ingredientId with an unordered bulk write.
+
+        provenances, if given, holds the provenance of each product (or None) in the same order.
+        """
+        if not products:
+            return 0
+
+        provenances = provenances or [None] * len(products)
+        operations = [
+            ReplaceOne({"ingredientId": product.ingredientId}, self._document(product, provenance), upsert=True)
+            for product, provenance in zip(products, provenances)
+        ]
+        collection = self.collection.with_options(write_concern=self.write_concern)
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            written_count = result.upserted_count + result.matched_count
+            logger.info(f"Upserted {written_count} products into MongoDB")
+            return written_count
+        except BulkWriteError as e:
+            written_count = e.details.get('nUpserted', 0) + e.details.get('nMatched', 0)
+            logger.error(f"Upserted {written_count} of {len(products)} products, "
+                         f"{len(e.details.get('writeErrors', []))} failed: {e}")
+            return written_count
+
     def product_exists(self, ingredient_id: int) -> bool:
         """Check if a product with given ingredientId already exists"""
         return self.collection.find_one({"ingredientId": ingredient_id}) is not None
     
+    def existing_ingredient_ids(self, ingredient_ids: Iterable[int]) -> Set[int]:
+        """Return the subset of ingredient ids that already have a product, in a single query"""
+        ingredient_ids = list(ingredient_ids)
+        if not ingredient_ids:
+            return set()
+
+        with metrics.timer('existence_check'):
+            cursor = self.collection.find(
+                {"ingredientId": {"$in": ingredient_ids}},
+                {"ingredientId": 1, "_id": 0}
+            )
+            return {document["ingredientId"] for document in cursor}
+
+    def reenrichment_candidates(self, llm1_model: str, llm2_model: str, prompt_version: str,
+                                limit: int = 0) -> List[int]:
+        """Ingredient ids of products worth re-enriching with the current models and prompts, in priority order.
+
+        Unconverged products come first (oldest first), then products without
+        provenance, then products made by another model or prompt version. The
+        tiers are disjoint, so each can be limited server-side. limit=0 returns
+        them all.
+        """
+        tiers = [
+            ("unconverged", {"provenance.status": "not_converged"}, [("provenance.processedAt", ASCENDING)]),
+            ("unstamped", {"provenance.status": None}, None),
+            ("stale", {"provenance.status": {"$nin": ["not_converged", None]}, "$or": [
+                {"provenance.promptVersion": {"$ne": prompt_version}},
+                {"provenance.llm1Model": {"$ne": llm1_model}},
+                {"provenance.llm2Model": {"$nin": [llm2_model, None]}},
+            ]}, None),
+        ]
+
+        ingredient_ids: List[int] = []
+        counts = {}
+        for name, query, sort in tiers:
+            remaining = limit - len(ingredient_ids) if limit else 0
+            if limit and remaining <= 0:
+                break
+            cursor = self.collection.find(query, {"ingredientId": 1, "_id": 0}, sort=sort, limit=remaining)
+            found = [document["ingredientId"] for document in cursor]
+            ingredient_ids.extend(found)
+            counts[name] = len(found)
+
+        logger.info("Re-enrichment candidates: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+        return ingredient_ids
+
     def get_product_by_ingredient_id(self, ingredient_id: int) -> Dict[str, Any]:
         """Retrieve a product by ingredientId"""
         return self.collection.find_one({"ingredientId": ingredient_id})
@@ -1,9 +1,10 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import logging
 from models import Ingredient
 from config import Config
+from telemetry.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -37,8 +38,9 @@ class PostgresClient:
                 if limit:
                     query += f" LIMIT {limit} OFFSET {offset}"
                 
-                cursor.execute(query)
-                rows = cursor.fetchall()
+                with metrics.timer('pg_fetch'):
+                    cursor.execute(query)
+                    rows = cursor.fetchall()
                 
                 ingredients = [
                     Ingredient(id=row['id'], name=row['name'], category=row['category'])
@@ -52,6 +54,59 @@ class PostgresClient:
             logger.error(f"Failed to retrieve{self.table_name}: {e}")
             raise
     
+    def iter_ingredients(self, chunk_size: int, start_after: int = 0,
+                         end_id: Optional[int] = None) -> Iterator[List[Ingredient]]:
+        """Stream ingredients in id order, one chunk at a time, using keyset pagination"""
+        last_id = start_after
+        while True:
+            try:
+                with self.connection.cursor() as cursor:
+                    query = f"SELECT id, name, category FROM {self.table_name} WHERE id > %s"
+                    params = [last_id]
+                    if end_id is not None:
+                        query += " AND id <= %s"
+                        params.append(end_id)
+                    query += " ORDER BY id LIMIT %s"
+                    params.append(chunk_size)
+
+                    with metrics.timer('pg_fetch'):
+                        cursor.execute(query, params)
+                        rows = cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Failed to retrieve {self.table_name} after id {last_id}: {e}")
+                raise
+
+            if not rows:
+                return
+
+            chunk = [
+                Ingredient(id=row['id'], name=row['name'], category=row['category'])
+                for row in rows
+            ]
+            last_id = chunk[-1].id
+            logger.info(f"Retrieved {len(chunk)} {self.table_name} up to id {last_id}")
+            yield chunk
+
+            if len(rows) < chunk_size:
+                return
+
+    def get_ingredients_by_ids(self, ingredient_ids: List[int]) -> List[Ingredient]:
+        """Retrieve the ingredients with the given ids in one query; missing ids are dropped"""
+        if not ingredient_ids:
+            return []
+        try:
+            with self.connection.cursor() as cursor:
+                with metrics.timer('pg_fetch'):
+                    cursor.execute(
+                        f"SELECT id, name, category FROM {self.table_name} WHERE id = ANY(%s) ORDER BY id",
+                        (list(ingredient_ids),)
+                    )
+                    rows = cursor.fetchall()
+                return [Ingredient(id=row['id'], name=row['name'], category=row['category']) for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to retrieve {len(ingredient_ids)} {self.table_name} by id: {e}")
+            raise
+
     def get_ingredient_by_id(self, ingredient_id: int) -> Optional[Ingredient]:
         """Retrieve a single ingredient by ID"""
         try:
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from models import Product, Provenance
+from config import Config
+from telemetry.metrics import metrics
+from database.mongo_client import MongoDBClient
+
+logger = logging.getLogger(__name__)
+
+class ProductWriteError(Exception):
+    """Raised by a strict flush when buffered products could not be written"""
+
+class ProductWriter:
+    """Write-behind buffer that upserts products to MongoDB every N products or T seconds.
+
+    on_flush, if given, is called with the ingredient ids of every fully written flush.
+    Products of a flush that fails, even partially, stay buffered and are retried
+    (upserts are idempotent), so callers must check pending, or flush with
+    strict=True, before recording anything as durable.
+    """
+
+    def __init__(self, mongo_client: MongoDBClient, flush_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None,
+                 on_flush: Optional[Callable[[List[int]], None]] = None):
+        self.mongo_client = mongo_client
+        self.on_flush = on_flush
+        self.flush_size = flush_size or Config.WRITE_FLUSH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else Config.WRITE_FLUSH_INTERVAL
+        self.written_count = 0
+
+        self._buffer: List[Tuple[Product, Optional[Provenance]]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._stop = threading.Event()
+        self._timer = None
+        if self.flush_interval > 0:
+            self._timer = threading.Thread(target=self._flush_periodically, name="product-writer", daemon=True)
+            self._timer.start()
+
+    def add(self, product: Product, provenance: Optional[Provenance] = None):
+        """Buffer a product and its provenance, flushing when the size threshold is reached"""
+        with self._lock:
+            self._buffer.append((product, provenance))
+            should_flush = len(self._buffer) >= self.flush_size
+        if should_flush:
+            self.flush()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered products not yet written"""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self, strict: bool = False) -> int:
+        """Upsert every buffered product, returning the number written.
+
+        With strict=True, raise ProductWriteError if products remain unwritten.
+        """
+        written = self._flush()
+        if strict and self.pending:
+            raise ProductWriteError(f"{self.pending} products could not be written to MongoDB")
+        return written
+
+    def _flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                items, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if not items:
+                return 0
+
+            products = [product for product, _ in items]
+            try:
+                with metrics.timer('mongo_write'):
+                    written = self.mongo_client.upsert_products(products, [provenance for _, provenance in items])
+            except Exception as e:
+                # Keep the products so the next flush retries them
+                logger.error(f"Failed to flush {len(products)} products, will retry: {e}")
+                with self._lock:
+                    self._buffer = items + self._buffer
+                return 0
+
+            if written < len(products):
+                # Failed documents are not identified, so the whole flush is retried
+                logger.error(f"Only {written} of {len(products)} products were written, will retry all of them")
+                with self._lock:
+                    self._buffer = items + self._buffer
+                return 0
+
+            self.written_count += written
+            metrics.inc('products_written_total', written)
+            if self.on_flush:
+                self.on_flush([product.ingredientId for product in products])
+            return written
+
+    def _flush_periodically(self):
+        """Background loop flushing the buffer once flush_interval has elapsed"""
+        while not self._stop.wait(min(self.flush_interval, 1.0)):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def close(self) -> int:
+        """Stop the background flusher and write out anything still buffered"""
+        self._stop.set()
+        if self._timer:
+            self._timer.join()
+        self.flush()
+        with self._lock:
+            if self._buffer:
+                logger.error(f"{len(self._buffer)} products could not be written to MongoDB")
+        logger.info(f"Product writer closed, {self.written_count} products written")
+        return self.written_count
@@ -0,0 +1,163 @@
+import logging
+import os
+import socket
+import threading
+from typing import Optional, Tuple
+from config import Config
+from database.postgres_client import PostgresClient
+
+logger = logging.getLogger(__name__)
+
+class WorkQueue:
+    """Lease-based queue of ingredient id ranges shared by workers through Postgres.
+
+    The ingredient table is split into fixed-size id ranges stored in a claims
+    table. Workers claim ranges with SELECT ... FOR UPDATE SKIP LOCKED, keep
+    their leases alive with a heartbeat, and mark ranges done when finished.
+    A range whose lease expires (because its worker died) can be claimed again.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, range_size: Optional[int] = None,
+                 lease_seconds: Optional[int] = None, heartbeat_seconds: Optional[int] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.range_size = range_size or Config.CLAIM_RANGE_SIZE
+        self.lease_seconds = lease_seconds or Config.LEASE_SECONDS
+        self.heartbeat_seconds = heartbeat_seconds or Config.HEARTBEAT_SECONDS
+        self.claims_table = Config.CLAIMS_TABLE
+        self.source_table = Config.POSTGRES_TABLE
+
+        self.pg_client = PostgresClient()
+        self._heartbeat_client = None
+        self._heartbeat_thread = None
+        self._stop = threading.Event()
+        self.ensure_table()
+
+    def _execute(self, query: str, params: tuple = (), fetch: bool = False):
+        """Run a statement in its own transaction"""
+        connection = self.pg_client.connection
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall() if fetch else None
+            connection.commit()
+            return rows
+        except Exception:
+            connection.rollback()
+            raise
+
+    def ensure_table(self):
+        """Create the claims table if it does not exist"""
+        self._execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.claims_table} (
+                range_start BIGINT PRIMARY KEY,
+                range_end BIGINT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker_id TEXT,
+                lease_expires_at TIMESTAMPTZ,
+                heartbeat_at TIMESTAMPTZ,
+                completed_at TIMESTAMPTZ
+            )
+            """
+        )
+
+    def seed(self) -> int:
+        """Create claim ranges covering every ingredient id, returning how many were added.
+
+        New ranges start after the last existing one and end at the current
+        MAX(id), so ids inserted later are covered by the ranges the next call adds.
+        """
+        rows = self._execute(
+            f"""
+            WITH bounds AS (
+                SELECT (SELECT COALESCE(MAX(range_end) + 1, 0) FROM {self.claims_table}) AS first_id,
+                       (SELECT COALESCE(MAX(id), -1) FROM {self.source_table}) AS last_id
+            )
+            INSERT INTO {self.claims_table} (range_start, range_end)
+            SELECT start, LEAST(start + %s - 1, last_id)
+            FROM bounds, generate_series(first_id, last_id, %s) AS start
+            ON CONFLICT (range_start) DO NOTHING
+            RETURNING range_start
+            """,
+            (self.range_size, self.range_size),
+            fetch=True
+        )
+        if rows:
+            logger.info(f"Seeded {len(rows)} new claim ranges of {self.range_size} ids")
+        return len(rows)
+
+    def claim(self) -> Optional[Tuple[int, int]]:
+        """Claim the next pending or expired range, returning its inclusive (start, end) ids"""
+        rows = self._execute(
+            f"""
+            UPDATE {self.claims_table}
+            SET status = 'claimed', worker_id = %s,
+                lease_expires_at = now() + make_interval(secs => %s), heartbeat_at = now()
+            WHERE range_start = (
+                SELECT range_start FROM {self.claims_table}
+                WHERE status = 'pending' OR (status = 'claimed' AND lease_expires_at < now())
+                ORDER BY range_start
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING range_start, range_end
+            """,
+            (self.worker_id, self.lease_seconds),
+            fetch=True
+        )
+        if not rows:
+            return None
+        claimed = (rows[0]['range_start'], rows[0]['range_end'])
+        logger.info(f"Worker {self.worker_id} claimed ingredient ids {claimed[0]}-{claimed[1]}")
+        return claimed
+
+    def complete(self, range_start: int):
+        """Mark a claimed range as done"""
+        self._execute(
+            f"UPDATE {self.claims_table} SET status = 'done', completed_at = now(), lease_expires_at = NULL "
+            "WHERE range_start = %s AND worker_id = %s",
+            (range_start, self.worker_id)
+        )
+
+    def release(self, range_start: int):
+        """Give a claimed range back to the queue, e.g. after an error"""
+        self._execute(
+            f"UPDATE {self.claims_table} SET status = 'pending', worker_id = NULL, lease_expires_at = NULL "
+            "WHERE range_start = %s AND worker_id = %s AND status = 'claimed'",
+            (range_start, self.worker_id)
+        )
+        logger.info(f"Worker {self.worker_id} released range starting at {range_start}")
+
+    def start_heartbeat(self):
+        """Extend this worker's leases periodically on a background thread with its own connection"""
+        self._heartbeat_client = PostgresClient()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        connection = self._heartbeat_client.connection
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {self.claims_table} "
+                        "SET lease_expires_at = now() + make_interval(secs => %s), heartbeat_at = now() "
+                        "WHERE worker_id = %s AND status = 'claimed'",
+                        (self.lease_seconds, self.worker_id)
+                    )
+                connection.commit()
+            except Exception as e:
+                logger.warning(f"Lease heartbeat failed for worker {self.worker_id}: {e}")
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+
+    def close(self):
+        """Stop the heartbeat and close the queue connections"""
+        self._stop.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join()
+        if self._heartbeat_client:
+            self._heartbeat_client.close()
+        self.pg_client.close()
@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+from telemetry.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a model whose circuit is open"""
+
+class CircuitBreaker:
+    """Stops sending requests to a model after max_failures consecutive failures.
+
+    The circuit stays open for reset_seconds, then lets a single trial request
+    through (half-open): success closes it again, failure re-opens it.
+    max_failures <= 0 disables the breaker.
+    """
+
+    def __init__(self, name: str, max_failures: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; counts rejections"""
+        if self.max_failures <= 0:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.opened_until:
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        metrics.inc('llm_breaker_rejections_total', model=self.name)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed again")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        if self.max_failures <= 0:
+            return
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.max_failures):
+                self.state = OPEN
+                self.opened_until = time.monotonic() + self.reset_seconds
+                self._trial_in_flight = False
+                logger.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} consecutive "
+                               f"failures, rejecting requests for {self.reset_seconds:g}s")
+                metrics.inc('llm_breaker_opened_total', model=self.name)
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+import ollama
+
+logger = logging.getLogger(__name__)
+
+class OllamaHost:
+    """One Ollama endpoint with its load and health statistics"""
+
+    def __init__(self, url: str, timeout: Optional[float] = None, probe_timeout: Optional[float] = None):
+        self.url = url
+        self.client = ollama.Client(host=url, timeout=timeout)
+        # Health checks get their own short timeout, so a dead host cannot hold them for a full request deadline
+        self.probe_client = ollama.Client(host=url, timeout=probe_timeout)
+        self.models: Optional[Set[str]] = None  # None until the host has been probed
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'host': self.url,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors,
+            'average_latency': round(self.total_latency / self.requests, 3) if self.requests else None,
+            'ejected': self.ejected_until > 0.0,
+        }
+
+class HostPool:
+    """Routes requests to the Ollama host with the fewest outstanding requests.
+
+    Hosts are ejected after max_failures consecutive failures and re-probed
+    with a model listing once eject_seconds have passed. Re-probes run on a
+    background thread, bounded by probe_timeout, so requests never wait for
+    them. timeout bounds every other HTTP request to the hosts (None = no timeout).
+    """
+
+    def __init__(self, urls: List[str], max_failures: int = 3, eject_seconds: float = 30.0,
+                 timeout: Optional[float] = None, probe_timeout: Optional[float] = 5.0):
+        if not urls:
+            raise ValueError("At least one Ollama host is required")
+        self.hosts = [OllamaHost(url, timeout, probe_timeout) for url in urls]
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def probe(self, host: OllamaHost) -> bool:
+        """List a host's models, reinstating it if it answers"""
+        try:
+            models = host.probe_client.list()
+        except Exception as e:
+            logger.warning(f"Probe of Ollama host {host.url} failed: {e}")
+            with self._lock:
+                host.ejected_until = time.monotonic() + self.eject_seconds
+            return False
+
+        with self._lock:
+            host.models = {model['name'] for model in models['models']}
+            if host.ejected_until:
+                logger.info(f"Ollama host {host.url} is healthy again")
+            host.ejected_until = 0.0
+            host.consecutive_failures = 0
+        return True
+
+    def probe_all(self) -> Dict[str, bool]:
+        return {host.url: self.probe(host) for host in self.hosts}
+
+    def acquire(self, model: str, avoid: Optional[OllamaHost] = None) -> OllamaHost:
+        """Pick the least-loaded healthy host serving model and count the request as outstanding.
+
+        avoid, if given, is only picked when no other healthy host serves the model.
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Ejected hosts whose timeout passed are re-probed in the background by the first caller to notice;
+            # they stay ejected until the probe reinstates them
+            due = [host for host in self.hosts if host.ejected_until and host.ejected_until <= now]
+            for host in due:
+                host.ejected_until = now + self.eject_seconds
+        for host in due:
+            threading.Thread(target=self.probe, args=(host,), name="host-probe", daemon=True).start()
+
+        with self._lock:
+            candidates = [host for host in self.hosts if not host.ejected_until and host.serves(model)]
+            if not candidates:
+                # Every host is ejected: try the one due back soonest rather than failing outright
+                serving = [host for host in self.hosts if host.serves(model)] or self.hosts
+                candidates = [min(serving, key=lambda host: host.ejected_until)]
+            if avoid is not None and len(candidates) > 1:
+                candidates = [host for host in candidates if host is not avoid]
+            host = min(candidates, key=lambda host: host.outstanding)
+            host.outstanding += 1
+            host.requests += 1
+            return host
+
+    def release(self, host: OllamaHost, success: bool, latency: float):
+        """Record the outcome of a request, ejecting the host after too many consecutive failures"""
+        with self._lock:
+            host.outstanding -= 1
+            host.total_latency += latency
+            if success:
+                host.consecutive_failures = 0
+                return
+            host.errors += 1
+            host.consecutive_failures += 1
+            if host.consecutive_failures >= self.max_failures and not host.ejected_until:
+                host.ejected_until = time.monotonic() + self.eject_seconds
+                logger.warning(f"Ejected Ollama host {host.url} after {host.consecutive_failures} consecutive failures")
+
+    def available_models(self) -> Set[str]:
+        """Models available on at least one healthy host"""
+        with self._lock:
+            return set().union(*(host.models or set() for host in self.hosts if not host.ejected_until))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [host.stats() for host in self.hosts]
@@ -0,0 +1,114 @@
+import json
+from typing import Any, Optional
+
+try:
+    import orjson  # Optional, faster JSON backend
+except ImportError:
+    orjson = None
+
+# Responses are scanned from at most this many candidate opening brackets
+MAX_DECODE_ATTEMPTS = 8
+
+_decoder = json.JSONDecoder()
+
+class JsonValueTracker:
+    """Incrementally track the nesting of a JSON object or array across text chunks.
+
+    Text before the first opening character is skipped, and brackets inside
+    string literals (including escaped quotes) are ignored, so the tracker can
+    tell exactly when the top-level value closes while a response is streaming.
+    """
+
+    def __init__(self, start_chars: str = '{'):
+        self.start_chars = start_chars
+        self.start = None   # Offset of the opening character in the fed text
+        self.end = None     # Offset just past the closing character
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.position = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> Optional[int]:
+        """Consume a chunk, returning the offset in it just past the closing bracket once complete"""
+        if self.complete:
+            return None
+
+        for index, char in enumerate(chunk):
+            if self.start is None:
+                if char in self.start_chars:
+                    self.start = self.position + index
+                    self.depth = 1
+                continue
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = self.position + index + 1
+                    self.position += index + 1
+                    return index + 1
+
+        self.position += len(chunk)
+        return None
+
+def loads(text: str) -> Any:
+    """Parse JSON with orjson when it is installed, falling back to the standard library"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def _fenced_blocks(text: str):
+    """Yield the contents of Markdown code fences, without the language tag"""
+    parts = text.split('```')
+    for block in parts[1:-1:2]:
+        newline = block.find('\n')
+        yield block[newline + 1:] if newline != -1 and block[:newline].strip().isalnum() else block
+
+def decode_json(text: str, start_chars: str = '{[') -> Optional[Any]:
+    """Decode the first JSON object or array in a model response, or return None.
+
+    A response that is only JSON is parsed directly (with orjson when
+    available). Otherwise the C decoder scans from the first opening bracket,
+    handling strings and escapes and stopping where the value ends, so the
+    payload is parsed once. Code-fenced blocks are tried before the whole text
+    so that brackets in the surrounding prose are ignored.
+    """
+    stripped = text.strip()
+    if stripped and stripped[0] in start_chars:
+        try:
+            return loads(stripped)
+        except ValueError:
+            pass
+
+    if '```' in text:
+        for block in _fenced_blocks(text):
+            value = decode_json(block, start_chars)
+            if value is not None:
+                return value
+
+    index = -1
+    for _ in range(MAX_DECODE_ATTEMPTS):
+        index = min((found for found in (text.find(char, index + 1) for char in start_chars) if found != -1),
+                    default=-1)
+        if index == -1:
+            return None
+        try:
+            value, _ = _decoder.raw_decode(text, index)
+            return value
+        except json.JSONDecodeError:
+            continue
+    return None
@@ -1,15 +1,79 @@
+import hashlib
+import httpx
 import ollama
 import json
 import logging
-from typing import Optional, Tuple, Dict, Any
-from models import Ingredient, Product
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Optional, Tuple, Dict, Any, List, Set, Union
+from pydantic import TypeAdapter, ValidationError
+from models import Ingredient, Product, ProductPatch
 from config import Config
+from llm.circuit_breaker import CircuitBreaker, CircuitOpenError
+from llm.host_pool import HostPool, OllamaHost
+from llm.json_scan import JsonValueTracker, decode_json
+from llm.response_cache import ResponseCache
+from telemetry.metrics import metrics
+from telemetry.prompt_trace import prompt_trace, OK, EMPTY, ERROR, INVALID
 
 logger = logging.getLogger(__name__)
 
+# Hedge delays are the HEDGE_QUANTILE of a model's last HEDGE_WINDOW request latencies,
+# once HEDGE_MIN_SAMPLES have been seen
+HEDGE_QUANTILE = 0.95
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+class RequestCancelled(Exception):
+    """Raised in the losing request of a hedged pair once the other one has answered"""
+
 class OllamaClient:
     def __init__(self):
-        self.client = ollama.Client(host=Config.OLLAMA_HOST)
+        # Requests are spread over every configured host; self.client is the first one
+        self.pool = HostPool(Config.OLLAMA_HOSTS, max_failures=Config.OLLAMA_MAX_FAILURES,
+                             eject_seconds=Config.OLLAMA_EJECT_SECONDS,
+                             timeout=Config.LLM_TIMEOUT_SECONDS or None,
+                             probe_timeout=Config.OLLAMA_PROBE_TIMEOUT_SECONDS or None)
+        self.client = self.pool.hosts[0].client
+        # Per-model circuit breakers and recent request latencies for hedging
+        self.breakers = {model: CircuitBreaker(model, Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_SECONDS)
+                         for model in (Config.LLM1_MODEL, Config.LLM2_MODEL)}
+        self._latencies: Dict[str, deque] = {}
+        self._latencies_lock = threading.Lock()
+        # Per-model in-flight limits, shared by every thread using this client. When both roles
+        # use the same model they share one semaphore, bounded by the smaller of the two limits.
+        if Config.LLM1_MODEL == Config.LLM2_MODEL:
+            limit = min(Config.LLM1_MAX_IN_FLIGHT, Config.LLM2_MAX_IN_FLIGHT)
+            if Config.LLM1_MAX_IN_FLIGHT != Config.LLM2_MAX_IN_FLIGHT:
+                logger.warning(f"LLM1 and LLM2 both use {Config.LLM1_MODEL}; limiting it to {limit} requests in "
+                               f"flight (LLM1_MAX_IN_FLIGHT={Config.LLM1_MAX_IN_FLIGHT}, "
+                               f"LLM2_MAX_IN_FLIGHT={Config.LLM2_MAX_IN_FLIGHT})")
+            self._model_slots = {Config.LLM1_MODEL: threading.BoundedSemaphore(limit)}
+        else:
+            self._model_slots = {
+                Config.LLM1_MODEL: threading.BoundedSemaphore(Config.LLM1_MAX_IN_FLIGHT),
+                Config.LLM2_MODEL: threading.BoundedSemaphore(Config.LLM2_MAX_IN_FLIGHT),
+            }
+        # JSON schemas for structured output, derived from the Product model
+        self.product_schema = Product.model_json_schema()
+        self.product_array_schema = TypeAdapter(List[Product]).json_schema()
+        self.patch_schema = ProductPatch.model_json_schema()
+        self.patch_array_schema = TypeAdapter(List[ProductPatch]).json_schema()
+        # Token counts reported by Ollama, per model
+        self.usage: Dict[str, Dict[str, int]] = {}
+        self._usage_lock = threading.Lock()
+        # Persistent response cache shared across runs (disabled when LLM_CACHE_PATH is empty)
+        self.cache = None
+        if Config.LLM_CACHE_PATH:
+            self.cache = ResponseCache(
+                Config.LLM_CACHE_PATH,
+                max_bytes=Config.LLM_CACHE_MAX_MB * 1024 * 1024,
+                ttl=Config.LLM_CACHE_TTL_HOURS * 3600 if Config.LLM_CACHE_TTL_HOURS > 0 else None
+            )
         self.food_transform_prompt = """
 You are a food knowledge assistant. Your task is to transform an Ingredient into a detailed Product JSON object for a food database.
 
@@ -132,63 +196,409 @@ Example input product JSON:
 Output the validated/corrected product JSON ONLY.
 """
 
+        self.patch_validator_prompt = """
+You are a food data validator reviewing a Product JSON created from an ingredient.
+
+Do NOT repeat the product. Output ONLY one of these JSON objects:
+- {"status": "ok"} if the product is correct
+- {"status": "patch", "changes": {...}} listing only the fields that must change
 
-    def _call_model(self, model: str, prompt: str, max_retries: int = 3) -> Optional[str]:
-        """Make a call to Ollama model with retry logic"""
-        # Log the input prompt
-        logger.info(f"\n{'='*50}\n{model} - Input:\n{prompt}\n{'='*50}")
-        
-        for attempt in range(max_retries):
+In "changes", use the top-level field name with its corrected value (brand, description, unit, allergens, userGenerated).
+For "nutritions", give only the nutrients to correct or add as { "value": number, "unit": string }, or null to remove one.
+
+Example input ingredient:
+{"id": 101, "name": "Cheddar Cheese", "category": "Dairy"}
+
+Example input product JSON:
+{"ingredientId": 101, "brand": "unbranded", "description": "", "unit": "g", "nutritions": {"energy": {"value": 402, "unit": "kcal"}, "protein": {"value": 25, "unit": "kg"}, "fat": {"value": 33, "unit": "g"}}, "allergens": [], "userGenerated": false}
+
+Example output:
+{"status": "patch", "changes": {"nutritions": {"protein": {"value": 25, "unit": "g"}}, "allergens": ["lactose"]}}
+
+Do NOT include any explanations or extra text before or after.
+"""
+
+        # Static instructions appended to the system prompts in packed mode
+        self.packed_transform_instructions = """
+You will receive a JSON array of ingredients. Return ONLY a JSON array containing one Product JSON object per ingredient, with ingredientId set to the ingredient's id.
+"""
+
+        self.packed_validator_instructions = """
+You will receive a JSON array of items, each made of an original ingredient, the Product JSON created from it and optionally issues found by automatic checks. Return ONLY a JSON array containing one corrected or validated Product JSON object per item, keeping its ingredientId.
+"""
+
+        self.packed_patch_instructions = """
+You will receive a JSON array of items, each made of an original ingredient, the Product JSON created from it and optionally issues found by automatic checks. Return ONLY a JSON array containing one verdict object per item, with "ingredientId" set to the product's ingredientId.
+"""
+
+        # Stamped on every product so that prompt changes can be detected
+        self.prompt_version = self._prompt_version()
+        # Background keep-alive requests, started by start_keep_alive
+        self._heartbeat = None
+        self._heartbeat_stop = threading.Event()
+
+
+    def _prompt_version(self) -> str:
+        """Short hash of every prompt and of the schemas the models are asked to follow"""
+        digest = hashlib.sha256()
+        for part in (self.food_transform_prompt, self.validator_prompt, self.patch_validator_prompt,
+                     self.packed_transform_instructions, self.packed_validator_instructions,
+                     self.packed_patch_instructions, json.dumps(self.product_schema, sort_keys=True)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:12]
+
+    def _model_slot(self, model: str):
+        """Return the semaphore limiting concurrent requests to a model"""
+        return self._model_slots.get(model) or nullcontext()
+
+    @staticmethod
+    def _compact_json(data: Any) -> str:
+        """Serialize data as compact JSON for prompts"""
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+    @staticmethod
+    def _ingredient_data(ingredient: Ingredient) -> Dict[str, Any]:
+        """Ingredient fields sent to the models"""
+        return {"id": ingredient.id, "name": ingredient.name, "category": ingredient.category}
+
+    def _output_format(self, schema: Dict[str, Any]) -> Optional[Any]:
+        """Ollama `format` value for the configured structured-output mode.
+
+        Ollama's plain JSON mode only produces objects, so array schemas are
+        only enforced in "schema" mode.
+        """
+        if Config.LLM_OUTPUT_FORMAT == 'schema':
+            return schema
+        if Config.LLM_OUTPUT_FORMAT == 'json' and schema.get('type') != 'array':
+            return 'json'
+        return None
+
+    def _parse_structured_product(self, response: str) -> Optional[Product]:
+        """Parse a structured-output response straight into a Product, or None if it is not one"""
+        if not Config.LLM_OUTPUT_FORMAT:
+            return None
+        try:
+            with metrics.timer('parse'):
+                return Product.model_validate_json(response)
+        except ValidationError as e:
+            logger.warning(f"Structured response did not validate as a Product, extracting JSON instead: "
+                           f"{self._describe_error(e)}")
+            return None
+
+    def _call_model(self, model: str, prompt: str, system: Optional[str] = None,
+                    format: Optional[Any] = None, expect_array: bool = False,
+                    ingredient_ids: Optional[List[int]] = None, max_retries: Optional[int] = None,
+                    refresh: bool = False) -> Optional[str]:
+        """Make a call to Ollama model with retry logic.
+
+        Static instructions go in the system message so consecutive requests share
+        a prompt prefix that Ollama can reuse from its KV cache. `format` is passed
+        to Ollama to constrain the output to JSON or to a JSON schema. In streaming
+        mode generation stops once the expected JSON object (or array) is closed.
+        Full prompts and responses go to the sampled prompt trace, not the log.
+
+        Each request is bounded by LLM_TIMEOUT_SECONDS, a failed attempt is
+        retried up to max_retries times (default LLM_MAX_RETRIES; 0 = a single
+        attempt) after an exponential backoff with full jitter, and requests to a
+        model whose circuit breaker is open fail immediately with CircuitOpenError.
+        With refresh=True the cached response is ignored and replaced by a new one.
+        """
+        if max_retries is None:
+            max_retries = Config.LLM_MAX_RETRIES
+        attempts = 1 + max(max_retries, 0)
+        request = self._build_request(model, prompt, system, format)
+
+        # Identical requests are answered from the persistent cache
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(request)
+            cached = None if refresh else self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"{model} - cached response for ingredients {ingredient_ids}")
+                metrics.inc('llm_cache_hits_total', model=model)
+                return cached
+
+        breaker = self.breakers.get(model) or CircuitBreaker(model, 0)
+        for attempt in range(attempts):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit for {model} is open, not sending the request")
+
+            started = time.monotonic()
             try:
-                response = self.client.chat(
-                    model=model,
-                    messages=[
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    options={
-                        'temperature': 0.1,  # Low temperature for consistent results
-                        'top_p': 0.9,
-                        'num_predict': 1000,  # Limit response length
-                    }
-                )
+                with self._model_slot(model):
+                    response = self._chat(request, expect_array)
+                breaker.record_success()
                 
                 if response and 'message' in response and 'content' in response['message']:
                     result = response['message']['content'].strip()
-                    # Log the output response
-                    logger.info(f"\n{'='*50}\n{model} - Output:\n{result}\n{'='*50}")
+                    self._record_usage(model, response)
+                    latency = time.monotonic() - started
+                    logger.info(f"{model} - response for ingredients {ingredient_ids}: "
+                                f"{len(result)} chars in {latency:.2f}s")
+                    prompt_trace.record(model, OK if result else EMPTY, prompt, result, ingredient_ids,
+                                        attempt=attempt + 1, latency=latency)
+                    if self.cache and result:
+                        self.cache.put(cache_key, model, result)
                     return result
                 
             except Exception as e:
+                breaker.record_failure()
+                if self._is_timeout(e):
+                    metrics.inc('llm_timeouts_total', model=model)
                 logger.warning(f"Attempt {attempt + 1} failed for model {model}: {e}")
-                if attempt == max_retries - 1:
+                prompt_trace.record(model, ERROR, prompt, None, ingredient_ids, attempt=attempt + 1,
+                                    latency=time.monotonic() - started, error=str(e))
+                if attempt == attempts - 1:
                     logger.error(f"All attempts failed for model {model}")
                     raise
+                # Back off outside the model slot so other requests can use it
+                metrics.inc('llm_retries_total', model=model)
+                time.sleep(self._backoff_delay(attempt))
         
-        logger.warning(f"\n{'='*50}\n{model} - No valid response received\n{'='*50}")
+        logger.warning(f"{model} - no valid response received for ingredients {ingredient_ids}")
+        prompt_trace.record(model, EMPTY, prompt, None, ingredient_ids, attempt=attempts)
         return None
 
-    def transform_ingredient_to_product(self, ingredient: Ingredient) -> Optional[Product]:
-        """Transform ingredient to product using LLM1"""
+    @staticmethod
+    def _describe_error(error: Exception) -> str:
+        """Describe an error for the log without the model output pydantic quotes in its messages"""
+        if isinstance(error, ValidationError):
+            fields = sorted({'.'.join(str(part) for part in detail['loc']) or 'root' for detail in error.errors()})
+            return f"{type(error).__name__}: {error.error_count()} errors in {', '.join(fields)}"
+        return f"{type(error).__name__}: {error}"
+
+    @staticmethod
+    def _build_request(model: str, prompt: str, system: Optional[str] = None,
+                       format: Optional[Any] = None) -> Dict[str, Any]:
+        """Build the chat request for a prompt; its hash is the response cache key"""
+        messages = []
+        if system:
+            messages.append({'role': 'system', 'content': system})
+        messages.append({'role': 'user', 'content': prompt})
+
+        request = {
+            'model': model,
+            'messages': messages,
+            'options': {
+                'temperature': 0.1,  # Low temperature for consistent results
+                'top_p': 0.9,
+                'num_predict': 1000,  # Limit response length
+            },
+        }
+        if format:
+            request['format'] = format
+        return request
+
+    def _reject_response(self, model: str, prompt: str, system: Optional[str], format: Optional[Any],
+                         response: str, ingredient_ids: List[int], **fields):
+        """Trace a response that could not be parsed and drop it from the cache.
+
+        Otherwise the same unusable answer would be replayed on every run.
+        """
+        prompt_trace.record(model, INVALID, prompt, response, ingredient_ids, **fields)
+        if self.cache:
+            self.cache.delete(self.cache.make_key(self._build_request(model, prompt, system, format)))
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Exponential backoff with full jitter: a random delay up to BASE * 2^attempt, capped"""
+        return random.uniform(0, min(Config.LLM_BACKOFF_MAX, Config.LLM_BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def _is_timeout(error: Exception) -> bool:
+        return isinstance(error, (httpx.TimeoutException, TimeoutError))
+
+    def _chat(self, request: Dict[str, Any], expect_array: bool = False) -> Dict[str, Any]:
+        """Send a chat request to the least-loaded healthy host, hedging it when LLM_HEDGE is set"""
+        host = self.pool.acquire(request['model'])
+        delay = self._hedge_delay(request['model']) if Config.LLM_HEDGE else None
+        if delay is None:
+            return self._send(host, request, expect_array)
+        return self._chat_hedged(host, request, expect_array, delay)
+
+    def _send(self, host: OllamaHost, request: Dict[str, Any], expect_array: bool = False,
+              cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Send a chat request to an acquired host and record the outcome.
+
+        Requests that can be cancelled are streamed, so that the losing request
+        of a hedged pair stops generating at its next chunk.
+        """
+        started = time.monotonic()
+        success = False
+        cancelled = False
         try:
-            ingredient_text = f"Ingredient: id={ingredient.id}, name='{ingredient.name}', category='{ingredient.category}'"
-            prompt = f"{self.food_transform_prompt}\n\n{ingredient_text}"
+            if Config.LLM_STREAM or cancel is not None:
+                response = self._chat_streaming(host.client, request, expect_array, cancel)
+            else:
+                response = host.client.chat(**request, keep_alive=Config.OLLAMA_KEEP_ALIVE)
+            success = True
+            return response
+        except RequestCancelled:
+            cancelled = True
+            raise
+        finally:
+            latency = time.monotonic() - started
+            # A cancelled hedge loser says nothing about the host's health
+            self.pool.release(host, success or cancelled, latency)
+            if success:
+                metrics.observe('llm_request_seconds', latency, model=request['model'])
+                with self._latencies_lock:
+                    self._latencies.setdefault(request['model'], deque(maxlen=HEDGE_WINDOW)).append(latency)
+            elif not cancelled:
+                metrics.inc('llm_request_errors_total', model=request['model'], host=host.url)
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """How long to wait before hedging a request to model, or None until enough latencies were seen"""
+        with self._latencies_lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(latencies[min(int(HEDGE_QUANTILE * len(latencies)), len(latencies) - 1)],
+                   Config.LLM_HEDGE_MIN_DELAY)
+
+    def _submit(self, host: OllamaHost, request: Dict[str, Any], expect_array: bool,
+                cancel: threading.Event) -> Future:
+        """Send a request on its own thread, returning a future for the response"""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self._send(host, request, expect_array, cancel))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="ollama-request", daemon=True).start()
+        return future
+
+    def _chat_hedged(self, host: OllamaHost, request: Dict[str, Any], expect_array: bool,
+                     delay: float) -> Dict[str, Any]:
+        """Send a request and, if it has not answered after delay seconds, a duplicate to another host.
+
+        The duplicate goes to the same host (another Ollama slot) when it is the
+        only one serving the model, and is skipped when the model has no free
+        in-flight slot. The first successful response wins and the other request
+        is cancelled.
+        """
+        model = request['model']
+        cancels = {'primary': threading.Event(), 'hedge': threading.Event()}
+        primary = self._submit(host, request, expect_array, cancels['primary'])
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        slot = self._model_slots.get(model)
+        if slot and not slot.acquire(blocking=False):
+            return primary.result()
+        hedge_host = self.pool.acquire(model, avoid=host)
+        metrics.inc('llm_hedges_total', model=model)
+        logger.info(f"{model} - no response from {host.url} after {delay:.2f}s, hedging on {hedge_host.url}")
+        hedge = self._submit(hedge_host, request, expect_array, cancels['hedge'])
+        if slot:
+            hedge.add_done_callback(lambda _: slot.release())
+
+        names = {primary: 'primary', hedge: 'hedge'}
+        pending = set(names)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        cancels[names[other]].set()
+                    if future is hedge:
+                        metrics.inc('llm_hedges_won_total', model=model)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _chat_streaming(self, client: ollama.Client, request: Dict[str, Any],
+                        expect_array: bool = False, cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Stream a chat response and stop generation as soon as the top-level JSON value is complete.
+
+        Returns a dict shaped like a non-streamed response, with time_to_first_token,
+        time_to_complete and stopped_early added. Raises TimeoutError once the
+        response takes longer than LLM_TIMEOUT_SECONDS in total, and
+        RequestCancelled once cancel is set.
+        """
+        started = time.monotonic()
+        tracker = JsonValueTracker('[' if expect_array else '{')
+        parts: List[str] = []
+        response: Dict[str, Any] = {}
+        time_to_first_token = None
+
+        stream = client.chat(**request, stream=True, keep_alive=Config.OLLAMA_KEEP_ALIVE)
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    raise RequestCancelled(f"{request['model']} request cancelled")
+                if Config.LLM_TIMEOUT_SECONDS and time.monotonic() - started > Config.LLM_TIMEOUT_SECONDS:
+                    raise TimeoutError(f"{request['model']} response exceeded {Config.LLM_TIMEOUT_SECONDS:g}s")
+                content = chunk.get('message', {}).get('content', '')
+                if content and time_to_first_token is None:
+                    time_to_first_token = time.monotonic() - started
+
+                end = tracker.feed(content)
+                parts.append(content if end is None else content[:end])
+                if chunk.get('done'):
+                    response = dict(chunk)
+                if end is not None or chunk.get('done'):
+                    break
+        finally:
+            # Closing the stream drops the connection, which makes Ollama stop generating
+            stream.close()
+
+        response['message'] = {'role': 'assistant', 'content': ''.join(parts)}
+        response['time_to_first_token'] = time_to_first_token
+        response['time_to_complete'] = time.monotonic() - started
+        response['stopped_early'] = tracker.complete and not response.get('done')
+
+        first_token_text = f"{time_to_first_token:.2f}s" if time_to_first_token is not None else "n/a"
+        logger.info(f"{request['model']} - time_to_first_token={first_token_text}, "
+                    f"time_to_complete={response['time_to_complete']:.2f}s, stopped_early={response['stopped_early']}")
+        return response
+
+    def _record_usage(self, model: str, response: Dict[str, Any]):
+        """Log and accumulate the prompt/generation token counts reported by Ollama.
+
+        Streams stopped early report no counts, so they only add to early_stops.
+        """
+        metrics.record_ollama(model, response)
+        with self._usage_lock:
+            usage = self.usage.setdefault(model, {'calls': 0, 'prompt_eval_count': 0, 'eval_count': 0, 'early_stops': 0})
+            usage['calls'] += 1
+            if response.get('stopped_early'):
+                usage['early_stops'] += 1
+                return
+            usage['prompt_eval_count'] += response.get('prompt_eval_count', 0)
+            usage['eval_count'] += response.get('eval_count', 0)
+        logger.info(f"{model} - prompt_eval_count={response.get('prompt_eval_count', 0)}, "
+                    f"eval_count={response.get('eval_count', 0)}")
+
+    def transform_ingredient_to_product(self, ingredient: Ingredient, refresh: bool = False) -> Optional[Product]:
+        """Transform ingredient to product using LLM1; refresh=True bypasses the response cache"""
+        try:
+            prompt = f"Ingredient: {self._compact_json(self._ingredient_data(ingredient))}"
+            output_format = self._output_format(self.product_schema)
             
-            response = self._call_model(Config.LLM1_MODEL, prompt)
+            response = self._call_model(Config.LLM1_MODEL, prompt, system=self.food_transform_prompt,
+                                        format=output_format, ingredient_ids=[ingredient.id], refresh=refresh)
             if not response:
                 return None
             
-            # Clean the response to extract JSON
-            json_str = self._extract_json(response)
-            if not json_str:
-                logger.error(f"No valid JSON found in LLM1 response for ingredient {ingredient.id}")
-                return None
-            
-            # Parse and validate JSON
-            product_data = json.loads(json_str)
-            product = Product(**product_data)
+            product = self._parse_structured_product(response)
+            if not product:
+                # Decode the JSON embedded in the response, then validate it
+                product_data = self._decode_json(response)
+                try:
+                    if product_data is None:
+                        raise ValueError("no valid JSON found")
+                    product = Product.model_validate(product_data)
+                except ValueError as e:
+                    logger.error(f"Invalid LLM1 response for ingredient {ingredient.id}: {self._describe_error(e)}")
+                    self._reject_response(Config.LLM1_MODEL, prompt, self.food_transform_prompt, output_format,
+                                          response, [ingredient.id])
+                    return None
             
             logger.info(f"Successfully transformed ingredient {ingredient.id} to product")
             return product
@@ -197,39 +607,47 @@ Output the validated/corrected product JSON ONLY.
             logger.error(f"JSON decode error for ingredient {ingredient.id}: {e}")
             return None
         except Exception as e:
-            logger.error(f"Error transforming ingredient {ingredient.id}: {e}")
+            logger.error(f"Error transforming ingredient {ingredient.id}: {self._describe_error(e)}")
             return None
 
-    def validate_and_correct_product(self, ingredient: Ingredient, product: Product) -> Optional[Product]:
-        """Validate and potentially correct product using LLM2"""
-        try:
-            ingredient_text = json.dumps({
-                "id": ingredient.id,
-                "name": ingredient.name,
-                "category": ingredient.category
-            }, indent=2)
-
-            product_json = json.dumps(product.model_dump(), indent=2)
+    def validate_and_correct_product(self, ingredient: Ingredient, product: Product,
+                                     violations: Optional[List[str]] = None, refresh: bool = False) -> Optional[Product]:
+        """Validate and potentially correct product using LLM2.
 
+        violations, if given, are rule-check failures listed in the prompt for LLM2 to fix.
+        refresh=True bypasses the response cache. Returns None when LLM2 gives no
+        usable answer, so that a failure is not mistaken for agreement.
+        """
+        try:
             prompt = (
-                f"{self.validator_prompt}Original ingredient:\n{ingredient_text}\n"
-                f"Product JSON to validate:\n{product_json}\n"
-                "Output ONLY the corrected or validated Product JSON with no explanation or extra text."
+                f"Original ingredient: {self._compact_json(self._ingredient_data(ingredient))}\n"
+                f"Product JSON to validate: {self._compact_json(product.model_dump())}"
             )
+            if violations:
+                prompt += "\nIssues found by automatic checks:\n" + "\n".join(f"- {v}" for v in violations)
+
+            if Config.LLM2_PATCH_MODE:
+                return self._validate_with_patch(ingredient, product, prompt, refresh)
 
-            response = self._call_model(Config.LLM2_MODEL, prompt)
+            output_format = self._output_format(self.product_schema)
+            response = self._call_model(Config.LLM2_MODEL, prompt, system=self.validator_prompt,
+                                        format=output_format, ingredient_ids=[ingredient.id], refresh=refresh)
             if not response:
-                return product  # Return original if validation fails
-            
-            # Clean the response to extract JSON
-            json_str = self._extract_json(response)
-            if not json_str:
-                logger.warning(f"No valid JSON found in LLM2 response for ingredient {ingredient.id}, using original")
-                return product
+                return None
             
-            # Parse and validate corrected JSON
-            corrected_data = json.loads(json_str)
-            corrected_product = Product(**corrected_data)
+            corrected_product = self._parse_structured_product(response)
+            if not corrected_product:
+                # Decode the JSON embedded in the response, then validate it
+                corrected_data = self._decode_json(response)
+                try:
+                    if corrected_data is None:
+                        raise ValueError("no valid JSON found")
+                    corrected_product = Product.model_validate(corrected_data)
+                except ValueError as e:
+                    logger.warning(f"Invalid LLM2 response for ingredient {ingredient.id}: {self._describe_error(e)}")
+                    self._reject_response(Config.LLM2_MODEL, prompt, self.validator_prompt, output_format,
+                                          response, [ingredient.id])
+                    return None
             
             # Check if there were changes
             if corrected_product.model_dump() != product.model_dump():
@@ -241,10 +659,286 @@ Output the validated/corrected product JSON ONLY.
                 
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error in validation for ingredient {ingredient.id}: {e}")
-            return product  # Return original if parsing fails
+            return None
         except Exception as e:
-            logger.error(f"Error validating product for ingredient {ingredient.id}: {e}")
-            return product  # Return original if validation fails
+            logger.error(f"Error validating product for ingredient {ingredient.id}: {self._describe_error(e)}")
+            return None
+
+    def _validate_with_patch(self, ingredient: Ingredient, product: Product, prompt: str,
+                             refresh: bool = False) -> Optional[Product]:
+        """Ask LLM2 for an "ok" verdict or a field-level patch and apply it locally; None if it gave neither"""
+        output_format = self._output_format(self.patch_schema)
+        response = self._call_model(Config.LLM2_MODEL, prompt, system=self.patch_validator_prompt,
+                                    format=output_format, ingredient_ids=[ingredient.id], refresh=refresh)
+        if not response:
+            return None
+
+        verdict = None
+        if Config.LLM_OUTPUT_FORMAT:
+            try:
+                verdict = ProductPatch.model_validate_json(response)
+            except ValidationError as e:
+                logger.warning(f"Structured response did not validate as a patch, extracting JSON instead: "
+                               f"{self._describe_error(e)}")
+        if not verdict:
+            verdict = self._parse_verdict(self._decode_json(response))
+            if verdict is None:
+                logger.warning(f"No valid verdict found in LLM2 response for ingredient {ingredient.id}")
+                self._reject_response(Config.LLM2_MODEL, prompt, self.patch_validator_prompt, output_format,
+                                      response, [ingredient.id])
+                return None
+
+        try:
+            return self._apply_verdict(ingredient, product, verdict)
+        except ValidationError as e:
+            # A patch that breaks the product is a failed validation, not an agreement
+            logger.warning(f"Patch for ingredient {ingredient.id} produced an invalid product: "
+                           f"{self._describe_error(e)}")
+            self._reject_response(Config.LLM2_MODEL, prompt, self.patch_validator_prompt, output_format,
+                                  response, [ingredient.id])
+            return None
+
+    @staticmethod
+    def _parse_verdict(data: Any) -> Optional[Union[ProductPatch, Product]]:
+        """Validate a decoded patch-mode answer as a patch, or as a full corrected Product.
+
+        Validators sometimes echo the whole corrected product instead of a patch;
+        that is a replacement, not an "ok". Anything else is invalid (None).
+        """
+        if not isinstance(data, dict):
+            return None
+        for model in (ProductPatch, Product):
+            try:
+                return model.model_validate(data)
+            except ValidationError:
+                continue
+        return None
+
+    def _apply_verdict(self, ingredient: Ingredient, product: Product,
+                       verdict: Union[ProductPatch, Product]) -> Product:
+        """Apply a patch, or use a full Product answer as the corrected product"""
+        if isinstance(verdict, ProductPatch):
+            return self._apply_patch(ingredient, product, verdict)
+        corrected_product = verdict.model_copy(update={'ingredientId': product.ingredientId})
+        if corrected_product.model_dump() == product.model_dump():
+            logger.info(f"LLM2 validated product for ingredient {ingredient.id} - no changes needed")
+            return product
+        logger.info(f"LLM2 replaced the product for ingredient {ingredient.id} instead of patching it")
+        return corrected_product
+
+    def _apply_patch(self, ingredient: Ingredient, product: Product, patch: ProductPatch) -> Product:
+        """Apply a validator patch to a product and re-validate it.
+
+        Returns the original product object when the patch is empty or changes nothing.
+        """
+        if patch.status != 'patch' or not patch.changes:
+            logger.info(f"LLM2 validated product for ingredient {ingredient.id} - no changes needed")
+            return product
+
+        data = product.model_dump()
+        for field, value in patch.changes.items():
+            if field == 'nutritions' and isinstance(value, dict):
+                for name, nutrition in value.items():
+                    if nutrition is None:
+                        data['nutritions'].pop(name, None)
+                    elif isinstance(nutrition, dict):
+                        data['nutritions'][name] = {**data['nutritions'].get(name, {}), **nutrition}
+                    else:
+                        data['nutritions'][name] = nutrition
+            elif field in Product.model_fields and field != 'ingredientId':
+                data[field] = value
+            else:
+                logger.warning(f"Ignoring patch to field '{field}' for ingredient {ingredient.id}")
+
+        corrected_product = Product.model_validate(data)
+        if corrected_product.model_dump() == product.model_dump():
+            logger.info(f"LLM2 validated product for ingredient {ingredient.id} - no changes needed")
+            return product
+
+        logger.info(f"LLM2 patched {', '.join(patch.changes)} for ingredient {ingredient.id}")
+        return corrected_product
+
+    def transform_ingredients_to_products(self, ingredients: List[Ingredient],
+                                          refresh: bool = False) -> Dict[int, Product]:
+        """Transform several ingredients with a single packed LLM1 request.
+
+        Products are matched back to ingredients by id; entries that are missing or
+        invalid in the packed response fall back to individual calls. refresh=True
+        bypasses the response cache.
+        """
+        if len(ingredients) == 1:
+            product = self.transform_ingredient_to_product(ingredients[0], refresh)
+            return {ingredients[0].id: product} if product else {}
+
+        products: Dict[int, Product] = {}
+        try:
+            prompt = f"Ingredients: {self._compact_json([self._ingredient_data(i) for i in ingredients])}"
+            system = self.food_transform_prompt + self.packed_transform_instructions
+            output_format = self._output_format(self.product_array_schema)
+
+            response = self._call_model(
+                Config.LLM1_MODEL, prompt,
+                system=system,
+                format=output_format,
+                expect_array=True,
+                ingredient_ids=[ingredient.id for ingredient in ingredients],
+                refresh=refresh
+            )
+            if response:
+                products = self._parse_product_array(response, {ingredient.id for ingredient in ingredients})
+                if len(products) < len(ingredients):
+                    self._reject_response(Config.LLM1_MODEL, prompt, system, output_format, response,
+                                          [ingredient.id for ingredient in ingredients], parsed=len(products))
+        except Exception as e:
+            logger.error(f"Error in packed transform of {len(ingredients)} ingredients: {self._describe_error(e)}")
+
+        missing = [ingredient for ingredient in ingredients if ingredient.id not in products]
+        if missing:
+            logger.warning(f"Packed LLM1 response missing {len(missing)} of {len(ingredients)} products, "
+                           "falling back to individual calls")
+        for ingredient in missing:
+            product = self.transform_ingredient_to_product(ingredient, refresh)
+            if product:
+                products[ingredient.id] = product
+        return products
+
+    def validate_and_correct_products(self, items: List[Tuple[Ingredient, Product]],
+                                      violations: Optional[Dict[int, List[str]]] = None,
+                                      refresh: bool = False) -> Dict[int, Product]:
+        """Validate several products with a single packed LLM2 request.
+
+        Unchanged products are returned as the original objects; entries that are
+        missing or invalid in the packed response fall back to individual calls.
+        Ingredients that LLM2 could not validate at all are left out of the result.
+        violations maps ingredient ids to rule-check failures listed for LLM2 to fix.
+        refresh=True bypasses the response cache.
+        """
+        violations = violations or {}
+        if len(items) == 1:
+            ingredient, product = items[0]
+            validated_product = self.validate_and_correct_product(ingredient, product, violations.get(ingredient.id),
+                                                                  refresh)
+            return {ingredient.id: validated_product} if validated_product else {}
+
+        validated: Dict[int, Product] = {}
+        try:
+            packed_items = []
+            for ingredient, product in items:
+                item = {"ingredient": self._ingredient_data(ingredient), "product": product.model_dump()}
+                if violations.get(ingredient.id):
+                    item["issues"] = violations[ingredient.id]
+                packed_items.append(item)
+            prompt = "Items: " + self._compact_json(packed_items)
+
+            if Config.LLM2_PATCH_MODE:
+                system = self.patch_validator_prompt + self.packed_patch_instructions
+                output_format = self._output_format(self.patch_array_schema)
+                response = self._call_model(
+                    Config.LLM2_MODEL, prompt,
+                    system=system,
+                    format=output_format,
+                    expect_array=True,
+                    ingredient_ids=[ingredient.id for ingredient, _ in items],
+                    refresh=refresh
+                )
+                if response:
+                    patches = self._parse_patch_array(response, {ingredient.id for ingredient, _ in items})
+                    for ingredient, product in items:
+                        if ingredient.id not in patches:
+                            continue
+                        try:
+                            validated[ingredient.id] = self._apply_verdict(ingredient, product, patches[ingredient.id])
+                        except ValidationError as e:
+                            logger.warning(f"Patch for ingredient {ingredient.id} produced an invalid product: "
+                                           f"{self._describe_error(e)}")
+                    # Patches that do not apply make the response as unusable as missing ones
+                    if len(validated) < len(items):
+                        self._reject_response(Config.LLM2_MODEL, prompt, system, output_format, response,
+                                              [ingredient.id for ingredient, _ in items], parsed=len(validated))
+                return self._fill_missing_validations(items, validated, violations, refresh)
+
+            system = self.validator_prompt + self.packed_validator_instructions
+            output_format = self._output_format(self.product_array_schema)
+            response = self._call_model(
+                Config.LLM2_MODEL, prompt,
+                system=system,
+                format=output_format,
+                expect_array=True,
+                ingredient_ids=[ingredient.id for ingredient, _ in items],
+                refresh=refresh
+            )
+            if response:
+                corrected = self._parse_product_array(response, {ingredient.id for ingredient, _ in items})
+                if len(corrected) < len(items):
+                    self._reject_response(Config.LLM2_MODEL, prompt, system, output_format, response,
+                                          [ingredient.id for ingredient, _ in items], parsed=len(corrected))
+                for ingredient, product in items:
+                    if ingredient.id not in corrected:
+                        continue
+                    if corrected[ingredient.id].model_dump() != product.model_dump():
+                        logger.info(f"LLM2 made corrections to product for ingredient {ingredient.id}")
+                        validated[ingredient.id] = corrected[ingredient.id]
+                    else:
+                        validated[ingredient.id] = product
+        except Exception as e:
+            logger.error(f"Error in packed validation of {len(items)} products: {self._describe_error(e)}")
+
+        return self._fill_missing_validations(items, validated, violations, refresh)
+
+    def _fill_missing_validations(self, items: List[Tuple[Ingredient, Product]], validated: Dict[int, Product],
+                                  violations: Dict[int, List[str]], refresh: bool = False) -> Dict[int, Product]:
+        """Validate items missing from a packed response with individual calls"""
+        missing = [(ingredient, product) for ingredient, product in items if ingredient.id not in validated]
+        if missing:
+            logger.warning(f"Packed LLM2 response missing {len(missing)} of {len(items)} products, "
+                           "falling back to individual calls")
+        for ingredient, product in missing:
+            validated_product = self.validate_and_correct_product(ingredient, product, violations.get(ingredient.id),
+                                                                  refresh)
+            if validated_product:
+                validated[ingredient.id] = validated_product
+        return validated
+
+    def _parse_patch_array(self, response: str, expected_ids: Set[int]) -> Dict[int, Union[ProductPatch, Product]]:
+        """Parse a JSON array of validator verdicts (patches or full products), keyed by ingredientId"""
+        data = self._decode_json(response, prefer_array=True)
+        if data is None:
+            logger.error("No valid JSON array found in packed patch response")
+            return {}
+
+        if isinstance(data, dict):
+            data = [data]
+
+        patches: Dict[int, Union[ProductPatch, Product]] = {}
+        for index, item in enumerate(data):
+            verdict = self._parse_verdict(item)
+            if verdict is None:
+                logger.warning(f"Skipping invalid verdict {index} in packed response ({type(item).__name__})")
+                continue
+            if verdict.ingredientId in expected_ids and verdict.ingredientId not in patches:
+                patches[verdict.ingredientId] = verdict
+        return patches
+
+    def _parse_product_array(self, response: str, expected_ids: Set[int]) -> Dict[int, Product]:
+        """Parse a JSON array of products, keeping valid entries whose ingredientId was requested"""
+        data = self._decode_json(response, prefer_array=True)
+        if data is None:
+            logger.error("No valid JSON array found in packed response")
+            return {}
+
+        if isinstance(data, dict):
+            data = [data]
+
+        products: Dict[int, Product] = {}
+        for index, item in enumerate(data):
+            try:
+                product = Product.model_validate(item)
+            except Exception as e:
+                logger.warning(f"Skipping invalid product {index} in packed response: {self._describe_error(e)}")
+                continue
+            if product.ingredientId in expected_ids and product.ingredientId not in products:
+                products[product.ingredientId] = product
+        return products
 
 #     def iterative_refinement(self, ingredient: Ingredient, max_iterations: int = 3) -> Tuple[Optional[Product], int]:
 #         """
@@ -306,46 +1000,30 @@ Output the validated/corrected product JSON ONLY.
 #         logger.info(f"Refinement completed after {max_iterations} iterations for ingredient {ingredient.id}")
 #         return current_product, max_iterations
 
-    def _extract_json(self, text: str) -> Optional[str]:
-        """Extract JSON from text response"""
-        text = text.strip()
-        
-        # Try to find JSON within the text
-        start_chars = ['{', '[']
-        end_chars = ['}', ']']
-        
-        for start_char, end_char in zip(start_chars, end_chars):
-            start_idx = text.find(start_char)
-            if start_idx != -1:
-                # Find the matching closing bracket
-                bracket_count = 0
-                for i, char in enumerate(text[start_idx:], start_idx):
-                    if char == start_char:
-                        bracket_count += 1
-                    elif char == end_char:
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            return text[start_idx:i+1]
-        
-        # If no brackets found, try to parse the entire text as JSON
-        try:
-            json.loads(text)
-            return text
-        except:
-            pass
-        
-        return None
+    def _decode_json(self, text: str, prefer_array: bool = False) -> Optional[Any]:
+        """Decode the first JSON object (or, with prefer_array, object or array) in a response"""
+        with metrics.timer('parse'):
+            return decode_json(text, '[{' if prefer_array else '{')
 
     def check_models_available(self) -> Dict[str, bool]:
-        """Check if the required models are available in Ollama"""
+        """Check if the required models are available on at least one Ollama host"""
         try:
-            models = self.client.list()
-            available_models = [model['name'] for model in models['models']]
+            hosts = self.pool.probe_all()
+            for host in self.pool.hosts:
+                if hosts[host.url]:
+                    missing = [m for m in (Config.LLM1_MODEL, Config.LLM2_MODEL) if not host.serves(m)]
+                    if missing:
+                        logger.warning(f"Ollama host {host.url} does not have {', '.join(missing)}")
+                else:
+                    logger.warning(f"Ollama host {host.url} is unreachable")
+
+            available_models = sorted(self.pool.available_models())
             
             return {
                 'llm1_available': Config.LLM1_MODEL in available_models,
                 'llm2_available': Config.LLM2_MODEL in available_models,
-                'available_models': available_models
+                'available_models': available_models,
+                'hosts': hosts
             }
         except Exception as e:
             logger.error(f"Failed to check available models: {e}")
@@ -353,4 +1031,95 @@ Output the validated/corrected product JSON ONLY.
                 'llm1_available': False,
                 'llm2_available': False,
                 'available_models': []
-            }
\ No newline at end of file
+            }
+
+    def _load_model(self, host: OllamaHost, model: str, reason: str) -> Optional[float]:
+        """Load a model on a host with an empty generate request, returning the load time in seconds.
+
+        Ollama loads the model (or refreshes its keep_alive if already loaded)
+        without generating anything. Load times go to model_load_seconds, apart
+        from the inference timings.
+        """
+        started = time.monotonic()
+        try:
+            host.client.generate(model=model, prompt='', keep_alive=Config.OLLAMA_KEEP_ALIVE)
+        except Exception as e:
+            logger.warning(f"Failed to load {model} on {host.url}: {e}")
+            metrics.inc('model_load_errors_total', model=model, reason=reason)
+            return None
+        elapsed = time.monotonic() - started
+        metrics.observe('model_load_seconds', elapsed, model=model, reason=reason)
+        return elapsed
+
+    def _load_targets(self, models: List[str]) -> List[Tuple[OllamaHost, str]]:
+        """Every (healthy host, model) pair where the host serves the model"""
+        return [(host, model) for model in dict.fromkeys(models) for host in self.pool.hosts
+                if not host.ejected_until and host.serves(model)]
+
+    def warm_up(self, models: Optional[List[str]] = None) -> Dict[str, Optional[float]]:
+        """Load the models on every host serving them, in parallel, before the first real request.
+
+        Returns the slowest load time of each model, or None if it failed everywhere.
+        """
+        models = models or [Config.LLM1_MODEL, Config.LLM2_MODEL]
+        targets = self._load_targets(models)
+        if not targets:
+            return {model: None for model in models}
+
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="warm-up") as executor:
+            load_times = list(executor.map(lambda target: self._load_model(*target, 'warmup'), targets))
+
+        loaded: Dict[str, Optional[float]] = {model: None for model in models}
+        for (host, model), load_time in zip(targets, load_times):
+            if load_time is not None:
+                logger.info(f"Loaded {model} on {host.url} in {load_time:.1f}s")
+                loaded[model] = max(loaded[model] or 0.0, load_time)
+        return loaded
+
+    def start_keep_alive(self, interval: Optional[float] = None):
+        """Refresh the models' keep_alive every interval seconds on a background thread until close()"""
+        interval = interval if interval is not None else Config.OLLAMA_HEARTBEAT_SECONDS
+        if interval <= 0 or self._heartbeat:
+            return
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(target=self._keep_alive, args=(interval,), name="ollama-keep-alive",
+                                           daemon=True)
+        self._heartbeat.start()
+        logger.info(f"Keeping models loaded with a heartbeat every {interval:g}s (keep_alive {Config.OLLAMA_KEEP_ALIVE})")
+
+    def _keep_alive(self, interval: float):
+        """Heartbeat loop: refresh every model that is still loaded.
+
+        A model that is no longer loaded although the heartbeat is shorter than
+        keep_alive was evicted to make room for the other one, so reloading it
+        would only make the host swap models; it is loaded again on demand.
+        """
+        while not self._heartbeat_stop.wait(interval):
+            for host, model in self._load_targets([Config.LLM1_MODEL, Config.LLM2_MODEL]):
+                try:
+                    running = {entry['name'] for entry in host.client.ps().get('models', [])}
+                except Exception:
+                    running = None  # Older Ollama without /api/ps: refresh unconditionally
+                if running is not None and model not in running:
+                    logger.info(f"{model} is not loaded on {host.url}, leaving it to be loaded on demand")
+                    metrics.inc('model_evictions_total', model=model)
+                    continue
+                self._load_model(host, model, 'heartbeat')
+
+    def close(self):
+        """Stop the heartbeat, report token usage, host and cache statistics and release the response cache"""
+        if self._heartbeat:
+            self._heartbeat_stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+        for model, usage in self.usage.items():
+            counted = usage['calls'] - usage['early_stops']
+            average = usage['prompt_eval_count'] / counted if counted else 0
+            logger.info(f"{model} usage: {usage['calls']} calls, {usage['prompt_eval_count']} prompt tokens "
+                        f"({average:.0f}/call), {usage['eval_count']} generated tokens, "
+                        f"{usage['early_stops']} streams stopped early")
+        for host_stats in self.pool.stats():
+            logger.info(f"Ollama host stats: {host_stats}")
+        if self.cache:
+            logger.info(f"LLM response cache stats: {self.cache.stats()}")
+            self.cache.close()
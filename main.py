@@ -1,7 +1,10 @@
+import argparse
 import logging
 import sys
+import time
+from typing import Optional
 from config import Config
-from processor.food_processor import process_batch
+from processor.food_processor import process_batch, process_all, process_worker, process_changes, process_reenrich
 from llm.ollama_client import OllamaClient
 
 # Configure logging
@@ -16,8 +19,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def check_environment():
-    """Check if all required services are available"""
+def check_environment() -> Optional[OllamaClient]:
+    """Check if all required services are available, returning the Ollama client to process with"""
+    ollama_client = None
     try:
         # Check Ollama models
         ollama_client = OllamaClient()
@@ -25,21 +29,59 @@ def check_environment():
         
         if not model_status['llm1_available']:
             logger.error(f"Primary model {Config.LLM1_MODEL} not available in Ollama")
-            return False
+            ollama_client.close()
+            return None
         
         if not model_status['llm2_available']:
             logger.error(f"Validator model {Config.LLM2_MODEL} not available in Ollama")
-            return False
+            ollama_client.close()
+            return None
             
         logger.info("✓ Ollama models available")
-        return True
+        return ollama_client
         
     except Exception as e:
         logger.error(f"Failed to check environment: {e}")
-        return False
+        if ollama_client:
+            ollama_client.close()
+        return None
+
+def warm_up(ollama_client: OllamaClient):
+    """Load both models before processing starts and keep them loaded for the rest of the run"""
+    if Config.OLLAMA_WARMUP:
+        started = time.monotonic()
+        load_times = ollama_client.warm_up()
+        for model, load_time in load_times.items():
+            if load_time is None:
+                logger.warning(f"Could not preload {model}, it will be loaded by its first request")
+        logger.info(f"✓ Models loaded in {time.monotonic() - started:.1f}s")
+    ollama_client.start_keep_alive()
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Transform PostgreSQL ingredients into MongoDB products using local LLMs")
+    parser.add_argument('--all', action='store_true',
+                        help="Stream the whole ingredient table in chunks instead of a single batch")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help=f"Rows per chunk in --all mode (default: CHUNK_SIZE={Config.CHUNK_SIZE})")
+    parser.add_argument('--resume', nargs='?', const='', default=None, metavar='RUN_ID',
+                        help=f"Resume an interrupted --all run from its journal in {Config.RUN_DIR}/ "
+                             "(default: the most recent run)")
+    parser.add_argument('--worker', nargs='?', const='', default=None, metavar='WORKER_ID',
+                        help="Process id ranges claimed from the shared Postgres work queue; "
+                             "run one per machine to split the table (default id: hostname-pid)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and enrich inserted or renamed ingredients as they change "
+                             "(Postgres LISTEN/NOTIFY with an updated_at watermark)")
+    # default=False tells "not given" apart from the bare flag (None: use REENRICH_LIMIT)
+    parser.add_argument('--reenrich', nargs='?', type=int, const=None, default=False, metavar='LIMIT',
+                        help="Re-enrich stored products that did not converge or were made by other models or "
+                             f"prompts, unconverged first (default limit: REENRICH_LIMIT={Config.REENRICH_LIMIT}, 0 = all)")
+    return parser.parse_args()
 
 def main():
     """Main entry point for the food processor"""
+    args = parse_args()
     try:
         logger.info("🟢 Food Processor starting...")
         logger.info(f"PostgreSQL: {Config.POSTGRES_HOST}:{Config.POSTGRES_PORT}")
@@ -47,12 +89,25 @@ def main():
         logger.info(f"Using models: {Config.LLM1_MODEL} (primary), {Config.LLM2_MODEL} (validator)")
         
         # Check environment
-        if not check_environment():
+        llm_client = check_environment()
+        if not llm_client:
             logger.error("Environment check failed, exiting")
             sys.exit(1)
+        warm_up(llm_client)
         
-        # Process ingredients
-        process_batch()
+        # Process ingredients; the processing functions close the client
+        if args.daemon:
+            process_changes(llm_client=llm_client)
+        elif args.reenrich is not False:
+            process_reenrich(limit=args.reenrich, chunk_size=args.chunk_size, llm_client=llm_client)
+        elif args.worker is not None:
+            process_worker(worker_id=args.worker or None, chunk_size=args.chunk_size, llm_client=llm_client)
+        elif args.resume is not None:
+            process_all(chunk_size=args.chunk_size, resume=True, run_id=args.resume or None, llm_client=llm_client)
+        elif args.all:
+            process_all(chunk_size=args.chunk_size, llm_client=llm_client)
+        else:
+            process_batch(llm_client=llm_client)
         
         logger.info("✅ Processing completed successfully")
         
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict
+from typing import Any, Dict, List, Literal, Optional
 
 class Ingredient(BaseModel):
     id: int
@@ -19,10 +20,27 @@ class Product(BaseModel):
     allergens: List[str]
     userGenerated: bool = False
 
+class ProductPatch(BaseModel):
+    # Strict, so that a full Product or a fragment of a truncated patch is not read as an "ok" verdict
+    model_config = ConfigDict(extra='forbid')
+
+    ingredientId: Optional[int] = None
+    status: Literal['ok', 'patch']
+    changes: Dict[str, Any] = {}
+
+class Provenance(BaseModel):
+    """How a stored product was produced, used to select products for re-enrichment"""
+    llm1Model: str
+    llm2Model: Optional[str] = None  # None when the rule checks skipped LLM2
+    promptVersion: str
+    iterations: int = 0
+    status: str  # "converged", "not_converged" or "rules"
+    processedAt: datetime
+
 class ProcessingResult(BaseModel):
     success: bool
     product: Optional[Product] = None
     error: Optional[str] = None
     iterations: int = 0
 
-__all__ = ['Ingredient', 'Nutrition', 'Product', 'ProcessingResult']
+__all__ = ['Ingredient', 'Nutrition', 'Product', 'ProductPatch', 'Provenance', 'ProcessingResult']
@@ -0,0 +1,71 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from models import Ingredient, Product, Provenance
+
+_NON_WORD = re.compile(r"[^\w]+")
+# Singulars ending in "ie", whose plural only adds an "s"
+_IE_SINGULARS = frozenset({"brownie", "calorie", "cookie", "hoagie", "smoothie", "veggie"})
+
+def _singularize(word: str) -> str:
+    """Reduce a plural English word to its singular form using simple suffix rules"""
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        # pies -> pie and cookies -> cookie, but berries -> berry and fries -> fry
+        if len(word) == 4 or word[:-1] in _IE_SINGULARS:
+            return word[:-1]
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes", "sses", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def canonical_text(text: str) -> str:
+    """Normalize case, accents, punctuation, whitespace and plurals of a name"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = _NON_WORD.sub(" ", text.casefold()).replace("_", " ").split()
+    return " ".join(_singularize(word) for word in words)
+
+def canonical_key(ingredient: Ingredient) -> Tuple[str, str]:
+    """Key under which ingredients are considered identical"""
+    return canonical_text(ingredient.name), canonical_text(ingredient.category)
+
+def group_by_canonical(ingredients: List[Ingredient]) -> Dict[Tuple[str, str], List[Ingredient]]:
+    """Group ingredients by canonical (name, category) key, preserving input order"""
+    groups: Dict[Tuple[str, str], List[Ingredient]] = {}
+    for ingredient in ingredients:
+        groups.setdefault(canonical_key(ingredient), []).append(ingredient)
+    return groups
+
+class CanonicalProducts:
+    """Products already produced in this run, by canonical key, so later chunks can reuse them.
+
+    Holds at most max_entries products, dropping the least recently used;
+    max_entries <= 0 disables it.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._products: "OrderedDict[Tuple[str, str], Tuple[Product, Provenance]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Tuple[Product, Provenance]]:
+        with self._lock:
+            entry = self._products.get(key)
+            if entry is not None:
+                self._products.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[str, str], product: Product, provenance: Provenance):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._products[key] = (product, provenance)
+            self._products.move_to_end(key)
+            while len(self._products) > self.max_entries:
+                self._products.popitem(last=False)
@@ -0,0 +1,95 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Sequence
+from config import Config
+from models import Nutrition, Product
+
+# Fields compared by the "important" policy, and the nutrients that matter within them
+IMPORTANT_FIELDS = ('unit', 'nutritions', 'allergens')
+IMPORTANT_NUTRIENTS = ('energy', 'protein', 'fat', 'carbohydrates', 'sugar', 'salt', 'fiber')
+
+class ConvergencePolicy(ABC):
+    """Decides whether two consecutive products of the refinement loop agree"""
+    name = "base"
+
+    @abstractmethod
+    def converged(self, previous: Product, current: Product) -> bool:
+        ...
+
+class ExactConvergence(ConvergencePolicy):
+    """Converged only when both products are exactly equal"""
+    name = "exact"
+
+    def converged(self, previous: Product, current: Product) -> bool:
+        return previous == current
+
+class TolerantConvergence(ConvergencePolicy):
+    """Converged when products agree within numeric tolerance.
+
+    Numbers are compared with relative/absolute tolerance, units and strings
+    case-insensitively, and allergens as order- and case-insensitive sets.
+    fields restricts the comparison to a subset of Product fields and
+    nutrients restricts which nutrition entries are compared.
+    """
+    name = "tolerant"
+
+    def __init__(self, rel_tol: float = 0.01, abs_tol: float = 0.1,
+                 fields: Optional[Sequence[str]] = None, nutrients: Optional[Sequence[str]] = None):
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        self.fields = tuple(fields) if fields else tuple(Product.model_fields)
+        self.nutrients = {nutrient.lower() for nutrient in nutrients} if nutrients else None
+
+    def _close(self, a: float, b: float) -> bool:
+        # Small epsilon so that nudges of exactly abs_tol count as equal despite float rounding
+        return abs(a - b) <= max(self.rel_tol * max(abs(a), abs(b)), self.abs_tol) + 1e-9
+
+    def _nutritions(self, nutritions: Dict[str, Nutrition]) -> Dict[str, Nutrition]:
+        normalized = {name.strip().lower(): nutrition for name, nutrition in nutritions.items()}
+        if self.nutrients is not None:
+            normalized = {name: nutrition for name, nutrition in normalized.items() if name in self.nutrients}
+        return normalized
+
+    def _same_nutritions(self, previous: Dict[str, Nutrition], current: Dict[str, Nutrition]) -> bool:
+        previous, current = self._nutritions(previous), self._nutritions(current)
+        if previous.keys() != current.keys():
+            return False
+        return all(
+            previous[name].unit.strip().lower() == current[name].unit.strip().lower()
+            and self._close(previous[name].value, current[name].value)
+            for name in previous
+        )
+
+    def converged(self, previous: Product, current: Product) -> bool:
+        for field in self.fields:
+            a, b = getattr(previous, field), getattr(current, field)
+            if field == 'nutritions':
+                same = self._same_nutritions(a, b)
+            elif field == 'allergens':
+                same = {x.strip().lower() for x in a} == {x.strip().lower() for x in b}
+            elif isinstance(a, str) and isinstance(b, str):
+                same = a.strip().lower() == b.strip().lower()
+            elif isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+                same = self._close(a, b)
+            else:
+                same = a == b
+            if not same:
+                return False
+        return True
+
+class ImportantFieldsConvergence(TolerantConvergence):
+    """Converged when consecutive products agree, within tolerance, on the important fields only"""
+    name = "important"
+
+    def __init__(self, rel_tol: float = 0.01, abs_tol: float = 0.1):
+        super().__init__(rel_tol, abs_tol, fields=IMPORTANT_FIELDS, nutrients=IMPORTANT_NUTRIENTS)
+
+def get_convergence_policy(name: Optional[str] = None) -> ConvergencePolicy:
+    """Build the convergence policy named by Config.CONVERGENCE_POLICY (exact, tolerant or important)"""
+    name = (name or Config.CONVERGENCE_POLICY).lower()
+    if name == 'exact':
+        return ExactConvergence()
+    if name == 'tolerant':
+        return TolerantConvergence(Config.CONVERGENCE_REL_TOL, Config.CONVERGENCE_ABS_TOL)
+    if name == 'important':
+        return ImportantFieldsConvergence(Config.CONVERGENCE_REL_TOL, Config.CONVERGENCE_ABS_TOL)
+    raise ValueError(f"Unknown convergence policy: {name}")
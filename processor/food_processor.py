@@ -1,79 +1,587 @@
 import logging
-from typing import Optional, List
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, Optional, List, Tuple
 from config import Config
 from database.postgres_client import PostgresClient
 from database.mongo_client import MongoDBClient
+from database.product_writer import ProductWriter
+from database.work_queue import WorkQueue
+from database.change_feed import ChangeFeed
 from llm.ollama_client import OllamaClient
-from models import Ingredient, Product
+from processor.canonical import CanonicalProducts, canonical_key, group_by_canonical
+from processor.journal import RunJournal, IN_FLIGHT, SKIPPED, FAILED
+from processor.convergence import ConvergencePolicy, get_convergence_policy
+from processor.rules import check_product
+from models import Ingredient, Product, Provenance
+from telemetry.metrics import metrics
+from telemetry.prompt_trace import prompt_trace
 
 logger = logging.getLogger(__name__)
 
-def process_ingredient(ingredient: Ingredient, llm_client: OllamaClient) -> Optional[Product]:
-    """Process a single ingredient through the LLM pipeline"""
+def _rule_violations(ingredient: Ingredient, product: Product) -> Optional[List[str]]:
+    """Run the rule-based pre-validator, returning None when it is disabled"""
+    if not Config.PRE_VALIDATION:
+        return None
+    violations = check_product(ingredient, product)
+    if violations:
+        logger.info(f"Rule checks failed for ingredient {ingredient.id}: {'; '.join(violations)}")
+    return violations
+
+def _record_outcome(ingredient_id: int, iterations: int, converged: bool, policy_name: str, started: float,
+                    llm_client: OllamaClient) -> Provenance:
+    """Log and record how many LLM2 iterations an ingredient needed, returning the product's provenance"""
+    status = "converged" if converged else "not converged"
+    logger.info(f"Ingredient {ingredient_id}: {iterations} LLM2 iterations, {status} ({policy_name})")
+    outcome = "rules" if policy_name == "rules" else status.replace(" ", "_")
+    metrics.ingredient_span(ingredient_id, started, outcome, iterations)
+    return Provenance(
+        llm1Model=Config.LLM1_MODEL,
+        llm2Model=Config.LLM2_MODEL if iterations else None,
+        promptVersion=llm_client.prompt_version,
+        iterations=iterations,
+        status=outcome,
+        processedAt=datetime.now(timezone.utc),
+    )
+
+def process_ingredient(ingredient: Ingredient, llm_client: OllamaClient, policy: Optional[ConvergencePolicy] = None,
+                       refresh: bool = False) -> Optional[Tuple[Product, Provenance]]:
+    """Process a single ingredient through the LLM pipeline, returning the product and its provenance.
+
+    With refresh=True every model call bypasses the response cache.
+    """
+    policy = policy or get_convergence_policy()
+    started = time.perf_counter()
     try:
         # Generate initial product data
-        product_data = llm_client.transform_ingredient_to_product(ingredient)
+        with metrics.timer('llm1'):
+            product_data = llm_client.transform_ingredient_to_product(ingredient, refresh)
         if not product_data:
             logger.error(f"Failed to generate product data for ingredient {ingredient.id}")
+            metrics.ingredient_span(ingredient.id, started, "failed")
             return None
 
+        # Consistent products skip LLM2 entirely
+        violations = _rule_violations(ingredient, product_data)
+        if violations == []:
+            logger.info(f"Product for ingredient {ingredient.id} passed rule checks, skipping validation")
+            return product_data, _record_outcome(ingredient.id, 0, True, "rules", started, llm_client)
+
         # Validate and refine through iterations
+        iterations = 0
+        converged = False
         for i in range(Config.MAX_ITERATIONS):
-            validated_data = llm_client.validate_and_correct_product(ingredient, product_data)
-            if validated_data == product_data:
-                logger.info(f"Product data converged after {i+1} iterations for ingredient {ingredient.id}")
+            iterations = i + 1
+            with metrics.timer('llm2', iteration=iterations):
+                validated_data = llm_client.validate_and_correct_product(ingredient, product_data, violations, refresh)
+            if validated_data is None:
+                # A failed validation is not agreement; keep the product but leave it unconverged
+                logger.warning(f"LLM2 failed for ingredient {ingredient.id}, keeping the unvalidated product")
+                converged = False
                 break
+            converged = policy.converged(product_data, validated_data)
             product_data = validated_data
+            if converged:
+                logger.info(f"Product data converged after {i+1} iterations for ingredient {ingredient.id}")
+                break
+            violations = _rule_violations(ingredient, product_data)
 
-        return validated_data
+        return product_data, _record_outcome(ingredient.id, iterations, converged, policy.name, started, llm_client)
     except Exception as e:
         logger.error(f"Error processing ingredient {ingredient.id}: {e}")
+        metrics.ingredient_span(ingredient.id, started, "failed")
         return None
 
-def process_batch(batch_size: int = None):
+def _packs(items: List, size: int) -> List[List]:
+    """Split items into consecutive packs of at most size elements"""
+    size = max(size, 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _map_concurrently(function: Callable, items: List) -> List:
+    """Apply function to every item, on a thread pool when Config.WORKERS > 1"""
+    if Config.WORKERS <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=Config.WORKERS, thread_name_prefix="pack") as executor:
+        return list(executor.map(function, items))
+
+def _model_switches(models: List[str]) -> int:
+    """Count how often consecutive calls in a sequence use a different model"""
+    return sum(1 for previous, current in zip(models, models[1:]) if previous != current)
+
+def process_ingredients_phased(ingredients: List[Ingredient], llm_client: OllamaClient,
+                               on_product: Optional[Callable[[Ingredient, Product, Provenance], None]] = None,
+                               refresh: bool = False) -> List[Product]:
+    """Process ingredients phase by phase so each model stays loaded while its phase runs.
+
+    Ingredients are taken PHASE_CHUNK_SIZE at a time (0 = all of them): the whole
+    chunk goes through the LLM1 transform phase, then through one LLM2 phase per
+    validation iteration. Requests inside a phase carry LLM1_PACK_SIZE /
+    LLM2_PACK_SIZE ingredients each. With refresh=True the response cache is bypassed.
+    """
+    chunk_size = Config.PHASE_CHUNK_SIZE or len(ingredients)
+    products: List[Product] = []
+    phases: List[str] = []
+    iterations: Dict[int, int] = {}
+    for chunk in _packs(ingredients, chunk_size):
+        products.extend(_process_phases(chunk, llm_client, on_product, phases, iterations, refresh))
+
+    # Compare with running each ingredient's calls back to back
+    switches = _model_switches(phases)
+    interleaved = _model_switches([
+        model for ingredient in ingredients
+        for model in [Config.LLM1_MODEL] + [Config.LLM2_MODEL] * iterations.get(ingredient.id, 0)
+    ])
+    logger.info(f"Phase scheduler: {len(phases)} phases, {switches} model switches for {len(ingredients)} ingredients "
+                f"({max(interleaved - switches, 0)} avoided versus per-ingredient scheduling)")
+    return products
+
+def _process_phases(ingredients: List[Ingredient], llm_client: OllamaClient,
+                    on_product: Optional[Callable[[Ingredient, Product, Provenance], None]],
+                    phases: List[str], iterations: Dict[int, int], refresh: bool = False) -> List[Product]:
+    """Run one scheduler chunk through its phases, appending the model of each phase to phases"""
+    by_id: Dict[int, Ingredient] = {ingredient.id: ingredient for ingredient in ingredients}
+    products: List[Product] = []
+    policy = get_convergence_policy()
+    started = time.perf_counter()
+
+    def transform(pack: List[Ingredient]) -> Dict[int, Product]:
+        with metrics.timer('llm1'):
+            return llm_client.transform_ingredients_to_products(pack, refresh)
+
+    # Generate initial product data, one packed request per LLM1 pack
+    current: Dict[int, Product] = {}
+    phases.append(Config.LLM1_MODEL)
+    for transformed in _map_concurrently(transform, _packs(ingredients, Config.LLM1_PACK_SIZE)):
+        current.update(transformed)
+    for ingredient in ingredients:
+        if ingredient.id not in current:
+            logger.error(f"Failed to generate product data for ingredient {ingredient.id}")
+            metrics.ingredient_span(ingredient.id, started, "failed")
+
+    def finish(ingredient_id: int, provenance: Provenance):
+        products.append(current[ingredient_id])
+        if on_product:
+            on_product(by_id[ingredient_id], current[ingredient_id], provenance)
+
+    # Consistent products skip LLM2 entirely
+    active = []
+    violations: Dict[int, List[str]] = {}
+    for ingredient in ingredients:
+        if ingredient.id not in current:
+            continue
+        found = _rule_violations(ingredient, current[ingredient.id])
+        if found == []:
+            logger.info(f"Product for ingredient {ingredient.id} passed rule checks, skipping validation")
+            finish(ingredient.id, _record_outcome(ingredient.id, 0, True, "rules", started, llm_client))
+            continue
+        violations[ingredient.id] = found or []
+        active.append(ingredient.id)
+
+    # Validate and refine the products that have not converged yet, one packed request per LLM2 pack
+    for i in range(Config.MAX_ITERATIONS):
+        if not active:
+            break
+        items = [(by_id[ingredient_id], current[ingredient_id]) for ingredient_id in active]
+        phases.append(Config.LLM2_MODEL)
+        for ingredient_id in active:
+            iterations[ingredient_id] = i + 1
+
+        def validate(pack: List, iteration: int = i + 1) -> Dict[int, Product]:
+            with metrics.timer('llm2', iteration=iteration):
+                return llm_client.validate_and_correct_products(pack, violations, refresh)
+
+        validated: Dict[int, Product] = {}
+        for result in _map_concurrently(validate, _packs(items, Config.LLM2_PACK_SIZE)):
+            validated.update(result)
+
+        remaining = []
+        for ingredient_id in active:
+            validated_data = validated.get(ingredient_id)
+            if validated_data is None:
+                # A failed validation is not agreement; keep the product but leave it unconverged
+                logger.warning(f"LLM2 failed for ingredient {ingredient_id}, keeping the unvalidated product")
+                finish(ingredient_id, _record_outcome(ingredient_id, i + 1, False, policy.name, started, llm_client))
+                continue
+            converged = policy.converged(current[ingredient_id], validated_data)
+            current[ingredient_id] = validated_data
+            if converged:
+                logger.info(f"Product data converged after {i+1} iterations for ingredient {ingredient_id}")
+                finish(ingredient_id, _record_outcome(ingredient_id, i + 1, True, policy.name, started, llm_client))
+            else:
+                violations[ingredient_id] = _rule_violations(by_id[ingredient_id], validated_data) or []
+                remaining.append(ingredient_id)
+        active = remaining
+
+    for ingredient_id in active:
+        finish(ingredient_id, _record_outcome(ingredient_id, Config.MAX_ITERATIONS, False, policy.name, started,
+                                              llm_client))
+    return products
+
+def process_ingredients(ingredients: List[Ingredient], llm_client: OllamaClient,
+                        on_product: Optional[Callable[[Ingredient, Product, Provenance], None]] = None,
+                        refresh: bool = False) -> List[Product]:
+    """Process ingredients phase by phase (Config.SCHEDULER = phased) or one ingredient at a time.
+
+    Per-ingredient scheduling runs sequentially or on a thread pool, depending on Config.WORKERS.
+    on_product, if given, is called with each ingredient, its product and the product's provenance
+    as soon as it is ready. With refresh=True the response cache is bypassed, so re-enrichment
+    gets new generations instead of the responses it is meant to replace.
+    """
+    if Config.SCHEDULER == 'phased' or Config.LLM1_PACK_SIZE > 1 or Config.LLM2_PACK_SIZE > 1:
+        return process_ingredients_phased(ingredients, llm_client, on_product, refresh)
+
+    products: List[Product] = []
+
+    def collect(ingredient: Ingredient, result: Optional[Tuple[Product, Provenance]]):
+        if result:
+            product, provenance = result
+            products.append(product)
+            if on_product:
+                on_product(ingredient, product, provenance)
+
+    if Config.WORKERS <= 1 or len(ingredients) <= 1:
+        for ingredient in ingredients:
+            collect(ingredient, process_ingredient(ingredient, llm_client, refresh=refresh))
+    else:
+        # Per-model in-flight limits are enforced inside OllamaClient
+        with ThreadPoolExecutor(max_workers=Config.WORKERS, thread_name_prefix="ingredient") as executor:
+            futures = {executor.submit(process_ingredient, ingredient, llm_client, refresh=refresh): ingredient
+                       for ingredient in ingredients}
+            for future in as_completed(futures):
+                try:
+                    collect(futures[future], future.result())
+                except Exception as e:
+                    logger.error(f"Worker failed for ingredient {futures[future].id}: {e}")
+
+    return products
+
+def process_chunk(ingredients: List[Ingredient], mongo_client: MongoDBClient, llm_client: OllamaClient,
+                  writer: ProductWriter, journal: Optional[RunJournal] = None, refresh: bool = False,
+                  known: Optional[CanonicalProducts] = None) -> int:
+    """Process one chunk of ingredients, handing each new product to the writer as it is produced.
+
+    With refresh=True ingredients are enriched even if they already have a product, which is replaced,
+    and the response cache is bypassed so the models generate new responses.
+    Products produced by earlier chunks are looked up in known and copied instead of enriched again.
+    Returns the number of products produced, including copies fanned out to duplicate ingredients.
+    """
+    # Skip ingredients the journal already recorded as finished when resuming
+    if journal:
+        finished_ids = journal.finished_ids(ingredient.id for ingredient in ingredients)
+        if finished_ids:
+            logger.info(f"Skipping {len(finished_ids)} ingredients finished before the run was interrupted")
+            ingredients = [ingredient for ingredient in ingredients if ingredient.id not in finished_ids]
+
+    # Skip ingredients that were already processed (one query per chunk)
+    existing_ids = set() if refresh else mongo_client.existing_ingredient_ids(ingredient.id for ingredient in ingredients)
+    pending = [ingredient for ingredient in ingredients if ingredient.id not in existing_ids]
+    if existing_ids:
+        logger.info(f"Skipping {len(existing_ids)} ingredients that already have products")
+    if journal:
+        journal.mark(existing_ids, SKIPPED)
+        journal.mark((ingredient.id for ingredient in pending), IN_FLIGHT)
+
+    # Run the pipeline once per canonical (name, category) group
+    known = known if Config.DEDUPLICATE else None
+    if Config.DEDUPLICATE:
+        groups = group_by_canonical(pending)
+        members = {group[0].id: group for group in groups.values()}
+        if len(groups) < len(pending):
+            logger.info(f"Deduplicated {len(pending)} ingredients into {len(groups)} canonical groups")
+    else:
+        members = {ingredient.id: [ingredient] for ingredient in pending}
+
+    produced_ids = set()
+
+    def fan_out(ingredient: Ingredient, product: Product, provenance: Provenance):
+        # Products become durable on the writer's next flush
+        for member in members[ingredient.id]:
+            writer.add(product.model_copy(update={"ingredientId": member.id}), provenance)
+            produced_ids.add(member.id)
+        if known is not None:
+            known.put(canonical_key(ingredient), product, provenance)
+
+    representatives = []
+    for group in members.values():
+        entry = known.get(canonical_key(group[0])) if known is not None else None
+        if entry:
+            fan_out(group[0], *entry)
+        else:
+            representatives.append(group[0])
+    if len(representatives) < len(members):
+        logger.info(f"Reused {len(members) - len(representatives)} products from earlier chunks")
+
+    process_ingredients(representatives, llm_client, on_product=fan_out, refresh=refresh)
+    if journal:
+        journal.mark((ingredient.id for ingredient in pending if ingredient.id not in produced_ids), FAILED)
+    if not produced_ids:
+        logger.info("No new products in this chunk")
+    return len(produced_ids)
+
+class _Clients:
+    """Clients and product writer of one run, opened by _open_clients"""
+
+    def __init__(self):
+        self.pg_client: Optional[PostgresClient] = None
+        self.mongo_client: Optional[MongoDBClient] = None
+        self.llm_client: Optional[OllamaClient] = None
+        self.writer: Optional[ProductWriter] = None
+
+@contextmanager
+def _open_clients(pg_client: Optional[PostgresClient] = None, mongo_client: Optional[MongoDBClient] = None,
+                  llm_client: Optional[OllamaClient] = None,
+                  on_flush: Optional[Callable[[List[int]], None]] = None) -> Iterator[_Clients]:
+    """Open the Postgres, MongoDB and Ollama clients of a run with a product writer, and tear them down.
+
+    Clients that are passed in are used instead of opening new ones, and are closed at the end like
+    the others. On exit, even after an error, pending products are flushed, every client is closed,
+    metrics are reported and the prompt trace is closed.
+    """
+    clients = _Clients()
+    try:
+        clients.pg_client = pg_client or PostgresClient()
+        clients.mongo_client = mongo_client or MongoDBClient()
+        clients.llm_client = llm_client or OllamaClient()
+        clients.writer = ProductWriter(clients.mongo_client, on_flush=on_flush)
+        yield clients
+    finally:
+        # Flush pending products, then close database connections
+        if clients.writer:
+            clients.writer.close()
+        for client in (clients.mongo_client or mongo_client, clients.pg_client or pg_client,
+                       clients.llm_client or llm_client):
+            if client:
+                client.close()
+        metrics.report()
+        prompt_trace.close()
+
+def process_batch(batch_size: int = None, pg_client: Optional[PostgresClient] = None,
+                  mongo_client: Optional[MongoDBClient] = None, llm_client: Optional[OllamaClient] = None):
     """Process a batch of ingredients from PostgreSQL to MongoDB"""
     if not batch_size:
         batch_size = Config.BATCH_SIZE
 
     logger.info(f"Starting batch processing with size {batch_size}")
-    
+
     try:
-        # Initialize clients
-        pg_client = PostgresClient()
-        mongo_client = MongoDBClient()
-        llm_client = OllamaClient()
-        
-        # Get ingredients from PostgreSQL
-        ingredients = pg_client.get_ingredients(limit=batch_size)
-        if not ingredients:
-            logger.info("No ingredients to process")
-            return
-        
-        logger.info(f"Retrieved {len(ingredients)} ingredients for processing")
-        
-        # Process each ingredient
-        processed_products: List[Product] = []
-        for ingredient in ingredients:
-            # Skip if already processed
-            if mongo_client.product_exists(ingredient.id):
-                logger.info(f"Product for ingredient {ingredient.id} already exists, skipping")
-                continue
-                
-            # Process the ingredient
-            product = process_ingredient(ingredient, llm_client)
-            if product:
-                processed_products.append(product)
-        
-        # Store results in MongoDB
-        if processed_products:
-            inserted_count = mongo_client.insert_products(processed_products)
-            logger.info(f"Successfully inserted {inserted_count} products into MongoDB")
-        else:
-            logger.info("No new products to insert")
-            
+        with _open_clients(pg_client, mongo_client, llm_client) as clients:
+            # Get ingredients from PostgreSQL
+            ingredients = clients.pg_client.get_ingredients(limit=batch_size)
+            if not ingredients:
+                logger.info("No ingredients to process")
+                return
+
+            logger.info(f"Retrieved {len(ingredients)} ingredients for processing")
+            process_chunk(ingredients, clients.mongo_client, clients.llm_client, clients.writer)
+
     except Exception as e:
         logger.error(f"Error in batch processing: {e}")
         raise
+
+def process_all(chunk_size: int = None, start_after: int = 0, resume: bool = False, run_id: Optional[str] = None,
+                pg_client: Optional[PostgresClient] = None, mongo_client: Optional[MongoDBClient] = None,
+                llm_client: Optional[OllamaClient] = None):
+    """Stream the whole ingredient table through the pipeline, one chunk at a time.
+
+    Progress is recorded in a run journal; with resume=True the run identified by
+    run_id (or the most recent one) continues after its last committed ingredient.
+    """
+    if resume:
+        journal = RunJournal.open(run_id)
+        chunk_size = chunk_size or int(journal.get('chunk_size', Config.CHUNK_SIZE))
+        start_after = journal.resume_after
+    else:
+        chunk_size = chunk_size or Config.CHUNK_SIZE
+        journal = RunJournal.create(chunk_size=chunk_size, start_after=start_after)
+
+    logger.info(f"Starting full-table processing with chunk size {chunk_size} after id {start_after} "
+                f"(run {journal.run_id})")
+
+    try:
+        with _open_clients(pg_client, mongo_client, llm_client, on_flush=journal.mark_done) as clients:
+            writer = clients.writer
+            known = CanonicalProducts(Config.DEDUPLICATE_MAX_ENTRIES)
+
+            total_seen = 0
+            total_processed = 0
+            for ingredients in clients.pg_client.iter_ingredients(chunk_size, start_after=start_after):
+                total_seen += len(ingredients)
+                total_processed += process_chunk(ingredients, clients.mongo_client, clients.llm_client, writer,
+                                                 journal, known=known)
+
+                # Make the chunk durable before moving the journal watermark past it; a failed
+                # flush raises, leaving the watermark where --resume must restart
+                writer.flush(strict=True)
+                journal.commit_chunk(ingredients[-1].id)
+                logger.info(f"Progress: {total_seen} ingredients seen, {total_processed} products processed, "
+                            f"{writer.written_count} written (last id {ingredients[-1].id})")
+
+            logger.info(f"Full-table processing finished: {total_seen} ingredients seen, "
+                        f"{total_processed} products processed")
+            journal.set('completed_at', time.time())
+
+    except Exception as e:
+        logger.error(f"Error in full-table processing: {e}")
+        raise
     finally:
-        # Close MongoDB connection
-        mongo_client.close()
+        journal.close()
+
+def process_reenrich(limit: Optional[int] = None, chunk_size: int = None,
+                     pg_client: Optional[PostgresClient] = None, mongo_client: Optional[MongoDBClient] = None,
+                     llm_client: Optional[OllamaClient] = None):
+    """Re-enrich stored products that did not converge or were made by other models or prompts.
+
+    Candidates are selected from the products' provenance (see
+    MongoDBClient.reenrichment_candidates) before processing starts, so products
+    that still do not converge are not retried within the same run. They are
+    then re-run in priority order, chunk_size at a time, replacing the stored products.
+    """
+    limit = limit if limit is not None else Config.REENRICH_LIMIT
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+
+    try:
+        with _open_clients(pg_client, mongo_client, llm_client) as clients:
+            mongo_client, llm_client, writer = clients.mongo_client, clients.llm_client, clients.writer
+
+            logger.info(f"Selecting products to re-enrich with {Config.LLM1_MODEL}, {Config.LLM2_MODEL} "
+                        f"and prompt version {llm_client.prompt_version}")
+            candidate_ids = mongo_client.reenrichment_candidates(Config.LLM1_MODEL, Config.LLM2_MODEL,
+                                                                 llm_client.prompt_version, limit)
+            if not candidate_ids:
+                logger.info("No products to re-enrich")
+                return
+
+            known = CanonicalProducts(Config.DEDUPLICATE_MAX_ENTRIES)
+            total_seen = 0
+            total_processed = 0
+            for chunk_ids in _packs(candidate_ids, chunk_size):
+                ingredients = clients.pg_client.get_ingredients_by_ids(chunk_ids)
+                if len(ingredients) < len(chunk_ids):
+                    logger.warning(f"{len(chunk_ids) - len(ingredients)} products have no ingredient left, "
+                                   "skipping them")
+                total_seen += len(chunk_ids)
+                total_processed += process_chunk(ingredients, mongo_client, llm_client, writer, refresh=True,
+                                                 known=known)
+                writer.flush()
+                logger.info(f"Re-enrichment progress: {total_seen}/{len(candidate_ids)} candidates, "
+                            f"{total_processed} products processed, {writer.written_count} written")
+
+            logger.info(f"Re-enrichment finished: {total_processed} of {len(candidate_ids)} products re-enriched")
+
+    except Exception as e:
+        logger.error(f"Error in re-enrichment: {e}")
+        raise
+
+def process_worker(worker_id: Optional[str] = None, chunk_size: int = None,
+                   pg_client: Optional[PostgresClient] = None, mongo_client: Optional[MongoDBClient] = None,
+                   llm_client: Optional[OllamaClient] = None):
+    """Process ingredient id ranges claimed from the shared Postgres work queue until none are left.
+
+    The queue keeps its own Postgres connections for claims and lease heartbeats.
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+
+    try:
+        with _open_clients(pg_client, mongo_client, llm_client) as clients:
+            queue = WorkQueue(worker_id)
+            try:
+                queue.seed()
+                queue.start_heartbeat()
+                logger.info(f"Worker {queue.worker_id} starting with chunk size {chunk_size}")
+                known = CanonicalProducts(Config.DEDUPLICATE_MAX_ENTRIES)
+
+                completed_ranges = 0
+                total_processed = 0
+                while True:
+                    claimed = queue.claim()
+                    if not claimed and queue.seed():
+                        # New ingredients were added since the queue was seeded
+                        claimed = queue.claim()
+                    if not claimed:
+                        break
+
+                    range_start, range_end = claimed
+                    try:
+                        for ingredients in clients.pg_client.iter_ingredients(chunk_size, start_after=range_start - 1,
+                                                                              end_id=range_end):
+                            total_processed += process_chunk(ingredients, clients.mongo_client, clients.llm_client,
+                                                             clients.writer, known=known)
+
+                        # The range is only complete once its products are durable; a failed flush
+                        # raises and the range is released for another attempt
+                        clients.writer.flush(strict=True)
+                        queue.complete(range_start)
+                        completed_ranges += 1
+                    except Exception:
+                        queue.release(range_start)
+                        raise
+
+                logger.info(f"Worker {queue.worker_id} finished: {completed_ranges} ranges, "
+                            f"{total_processed} products processed")
+            finally:
+                queue.close()
+
+    except Exception as e:
+        logger.error(f"Error in worker processing: {e}")
+        raise
+
+def process_changes(poll_seconds: Optional[float] = None, pg_client: Optional[PostgresClient] = None,
+                    mongo_client: Optional[MongoDBClient] = None, llm_client: Optional[OllamaClient] = None):
+    """Run as a daemon, enriching inserted and renamed ingredients as they change.
+
+    Changes arrive through Postgres LISTEN/NOTIFY and are coalesced into
+    micro-batches; when idle, the daemon catches up from its updated_at
+    watermark. Changed ingredients are re-enriched even if they already have a
+    product. Runs until interrupted. The change feed queries through pg_client
+    and listens on a connection of its own.
+    """
+    poll_seconds = poll_seconds or Config.CDC_POLL_SECONDS
+
+    try:
+        with _open_clients(pg_client, mongo_client, llm_client) as clients:
+            writer = clients.writer
+            feed = ChangeFeed(pg_client=clients.pg_client)
+            try:
+                feed.start()
+                known = CanonicalProducts(Config.DEDUPLICATE_MAX_ENTRIES)
+                logger.info(f"Listening for ingredient changes on {feed.channel} "
+                            f"(micro-batches of up to {feed.batch_size}, {feed.batch_window}s window)")
+
+                total_processed = 0
+                catching_up = True  # Drain changes made while the daemon was down before waiting for new ones
+                while True:
+                    if catching_up:
+                        ingredients = feed.poll()
+                        trigger = "watermark"
+                        catching_up = len(ingredients) == feed.batch_size
+                    else:
+                        changed_ids = feed.wait(poll_seconds)
+                        if not changed_ids:
+                            catching_up = True
+                            continue
+                        ingredients = feed.fetch(changed_ids)
+                        trigger = "notification"
+                    if not ingredients:
+                        continue
+
+                    started = time.monotonic()
+                    total_processed += process_chunk(ingredients, clients.mongo_client, clients.llm_client, writer,
+                                                     refresh=True, known=known)
+
+                    # Only move the watermark once the products are durable; unwritten products stay
+                    # buffered and the watermark stays put, so a restart re-reads those changes
+                    writer.flush()
+                    if writer.pending:
+                        logger.warning(f"{writer.pending} products not written yet, keeping the change feed watermark")
+                    else:
+                        feed.commit()
+                    logger.info(f"Enriched {len(ingredients)} changed ingredients ({trigger}) in "
+                                f"{time.monotonic() - started:.1f}s; {total_processed} products since start")
+            finally:
+                feed.close()
+
+    except Exception as e:
+        logger.error(f"Error in change processing: {e}")
+        raise
@@ -0,0 +1,148 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Set
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Item statuses recorded in the journal
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+# Failed items are not finished: a resumed run tries them again
+FINISHED_STATUSES = (DONE, SKIPPED)
+
+class RunJournal:
+    """Crash-safe SQLite journal of a streaming run, used to resume where it stopped.
+
+    The journal stores the last committed ingredient id (every id up to it is
+    finished and durable in MongoDB) and the status of every item it has seen.
+    Item updates are committed, and therefore fsynced, in batches of sync_every.
+
+    Resuming retries the failed items of the chunk that was interrupted. Items
+    that failed in committed chunks stay recorded as failed; they have no
+    product, so a new (non-resumed) run picks them up.
+    """
+
+    def __init__(self, run_id: str, run_dir: Optional[str] = None, sync_every: Optional[int] = None):
+        self.run_id = run_id
+        self.run_dir = os.path.join(run_dir or Config.RUN_DIR, run_id)
+        self.sync_every = sync_every or Config.JOURNAL_SYNC_EVERY
+        os.makedirs(self.run_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pending_updates = 0
+        self._connection = sqlite3.connect(os.path.join(self.run_dir, 'journal.sqlite'), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "ingredient_id INTEGER PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    @classmethod
+    def create(cls, run_dir: Optional[str] = None, **settings) -> 'RunJournal':
+        """Start a journal for a new run, recording its settings"""
+        # The pid keeps runs started in the same second apart
+        journal = cls(f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}", run_dir)
+        for key, value in settings.items():
+            journal.set(key, value)
+        journal.set('started_at', time.time())
+        journal.sync()
+        logger.info(f"Run journal {journal.run_id} created in {journal.run_dir}")
+        return journal
+
+    @classmethod
+    def open(cls, run_id: Optional[str] = None, run_dir: Optional[str] = None) -> 'RunJournal':
+        """Open the journal of an existing run, or of the most recent one when run_id is None"""
+        run_dir = run_dir or Config.RUN_DIR
+        if not run_id:
+            runs = sorted(
+                entry for entry in os.listdir(run_dir)
+                if os.path.exists(os.path.join(run_dir, entry, 'journal.sqlite'))
+            ) if os.path.isdir(run_dir) else []
+            if not runs:
+                raise FileNotFoundError(f"No run journal found in {run_dir}")
+            run_id = runs[-1]
+        elif not os.path.exists(os.path.join(run_dir, run_id, 'journal.sqlite')):
+            raise FileNotFoundError(f"No run journal for run {run_id} in {run_dir}")
+
+        journal = cls(run_id, run_dir)
+        logger.info(f"Resuming run {run_id} after ingredient id {journal.resume_after}")
+        return journal
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO run (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def last_committed_id(self) -> int:
+        return int(self.get('last_committed_id', '0'))
+
+    @property
+    def resume_after(self) -> int:
+        """Ingredient id a resumed run continues after: the run's start_after or its last committed id"""
+        return max(int(self.get('start_after', '0')), self.last_committed_id)
+
+    def mark(self, ingredient_ids: Iterable[int], status: str):
+        """Record the status of items, committing once sync_every updates have accumulated"""
+        now = time.time()
+        rows = [(ingredient_id, status, now) for ingredient_id in ingredient_ids]
+        if not rows:
+            return
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO items (ingredient_id, status, updated_at) VALUES (?, ?, ?)", rows
+            )
+            self._pending_updates += len(rows)
+            if self._pending_updates >= self.sync_every:
+                self._commit()
+
+    def mark_done(self, ingredient_ids: Iterable[int]):
+        self.mark(ingredient_ids, DONE)
+
+    def finished_ids(self, ingredient_ids: Iterable[int]) -> Set[int]:
+        """Return the subset of ingredient ids already done or skipped in this run"""
+        ingredient_ids = list(ingredient_ids)
+        if not ingredient_ids:
+            return set()
+        placeholders = ','.join('?' * len(ingredient_ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT ingredient_id FROM items WHERE ingredient_id IN ({placeholders}) "
+                f"AND status IN ({','.join('?' * len(FINISHED_STATUSES))})",
+                (*ingredient_ids, *FINISHED_STATUSES)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def commit_chunk(self, last_id: int):
+        """Advance the committed watermark once every item up to last_id is durable"""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO run (key, value) VALUES ('last_committed_id', ?)", (str(last_id),)
+            )
+            self._commit()
+
+    def sync(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self._connection.commit()
+        self._pending_updates = 0
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._connection.close()
@@ -0,0 +1,88 @@
+from typing import Dict, List, Optional
+from config import Config
+from models import Ingredient, Product
+from processor.canonical import canonical_text
+
+# Conversion factors to grams and kilocalories
+MASS_UNITS = {'kg': 1000.0, 'g': 1.0, 'mg': 1e-3, 'µg': 1e-6, 'ug': 1e-6, 'mcg': 1e-6}
+ENERGY_UNITS = {'kcal': 1.0, 'kj': 1 / 4.184}
+OTHER_UNITS = {'iu'}
+
+# Nutrient names the models commonly use for the same quantity
+NUTRIENT_ALIASES = {
+    'energy': 'energy', 'calories': 'energy', 'calorie': 'energy',
+    'protein': 'protein', 'proteins': 'protein',
+    'fat': 'fat', 'fats': 'fat', 'total_fat': 'fat',
+    'carbohydrates': 'carbohydrates', 'carbohydrate': 'carbohydrates', 'carbs': 'carbohydrates',
+}
+
+# Allergens expected for ingredient categories (canonical category word -> accepted allergen names, preferred first)
+CATEGORY_ALLERGENS = {
+    'dairy': ('lactose', 'milk', 'dairy'),
+    'cheese': ('lactose', 'milk', 'dairy'),
+    'egg': ('egg', 'eggs'),
+    'fish': ('fish',),
+    'seafood': ('fish', 'shellfish', 'crustacean', 'crustaceans', 'mollusc', 'molluscs', 'mollusk', 'mollusks'),
+    'shellfish': ('shellfish', 'crustacean', 'crustaceans', 'mollusc', 'molluscs'),
+    'nut': ('nuts', 'tree nuts', 'tree_nuts', 'peanuts', 'peanut'),
+}
+
+# Atwater factors in kcal per gram
+ATWATER = {'protein': 4.0, 'fat': 9.0, 'carbohydrates': 4.0}
+
+def _grams(value: float, unit: str) -> Optional[float]:
+    factor = MASS_UNITS.get(unit.strip().lower())
+    return value * factor if factor is not None else None
+
+def _kcal(value: float, unit: str) -> Optional[float]:
+    factor = ENERGY_UNITS.get(unit.strip().lower())
+    return value * factor if factor is not None else None
+
+def check_product(ingredient: Ingredient, product: Product) -> List[str]:
+    """Check a product against deterministic nutrition rules, returning the violations found"""
+    violations: List[str] = []
+    grams: Dict[str, float] = {}
+    energy_kcal: Optional[float] = None
+
+    for name, nutrition in product.nutritions.items():
+        unit = nutrition.unit.strip().lower()
+        canonical = NUTRIENT_ALIASES.get(name.strip().lower())
+
+        if nutrition.value < 0:
+            violations.append(f"{name} has a negative value ({nutrition.value} {nutrition.unit})")
+
+        if canonical == 'energy':
+            energy_kcal = _kcal(nutrition.value, unit)
+            if energy_kcal is None:
+                violations.append(f"energy unit '{nutrition.unit}' is not convertible (use kcal or kJ)")
+        elif unit in MASS_UNITS:
+            if canonical:
+                grams[canonical] = _grams(nutrition.value, unit)
+        elif unit not in OTHER_UNITS:
+            violations.append(f"{name} unit '{nutrition.unit}' is not a valid unit (use g, mg or µg)")
+
+    # Macronutrients cannot weigh more than the reference quantity
+    reference = 1000.0 if product.unit.strip().lower() in ('kg', 'l') else 100.0
+    macros = sum(grams.get(name, 0.0) for name in ATWATER)
+    if macros > reference * 1.02:
+        violations.append(f"protein + fat + carbohydrates = {macros:.1f} g exceeds {reference:.0f} g "
+                          f"per {reference:.0f} g")
+
+    # Energy should match the Atwater estimate from the macronutrients
+    if energy_kcal is not None and all(name in grams for name in ATWATER):
+        estimate = sum(grams[name] * factor for name, factor in ATWATER.items())
+        tolerance = max(estimate * Config.RULES_ENERGY_TOLERANCE, 20.0)
+        if abs(energy_kcal - estimate) > tolerance:
+            violations.append(f"energy {energy_kcal:.0f} kcal does not match the Atwater estimate "
+                              f"{estimate:.0f} kcal from protein, fat and carbohydrates")
+
+    # Allergens should agree with the category
+    allergens = {allergen.strip().lower() for allergen in product.allergens}
+    for word in canonical_text(ingredient.category).split():
+        expected = CATEGORY_ALLERGENS.get(word)
+        if expected and not allergens.intersection(expected):
+            violations.append(f"category '{ingredient.category}' implies the allergen '{expected[0]}', "
+                              f"but allergens are {product.allergens}")
+            break
+
+    return violations
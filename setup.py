@@ -10,6 +10,7 @@ setup(
         "psycopg2-binary==2.9.7",
         "pymongo==4.5.0",
         "ollama==0.2.1",
+        "httpx==0.27.2",
         "requests==2.31.0",
         "python-dotenv==1.0.0",
         "pydantic==2.4.2",
@@ -0,0 +1,289 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from config import Config
+from telemetry.timeline import Timeline, INGREDIENTS_PID
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'food_processor_'
+
+# Histogram bucket upper bounds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+ITERATION_BUCKETS = (0, 1, 2, 3, 4, 5, 10)
+BUCKETS = {
+    'ollama_prompt_tokens': TOKEN_BUCKETS,
+    'ollama_generated_tokens': TOKEN_BUCKETS,
+    'ollama_generated_tokens_per_second': RATE_BUCKETS,
+    'llm2_iterations': ITERATION_BUCKETS,
+}
+
+# Ollama duration fields (nanoseconds) and the histograms they are recorded in
+OLLAMA_DURATIONS = {
+    'total_duration': 'ollama_total_seconds',
+    'load_duration': 'ollama_load_seconds',
+    'prompt_eval_duration': 'ollama_prompt_eval_seconds',
+    'eval_duration': 'ollama_eval_seconds',
+}
+
+# Counters summarised per model on the tail latency line of the run summary
+TAIL_COUNTERS = ('llm_timeouts_total', 'llm_retries_total', 'llm_hedges_total', 'llm_hedges_won_total',
+                 'llm_breaker_opened_total', 'llm_breaker_rejections_total')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Cumulative-bucket histogram with count, sum, min and max"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket containing it, capped at the maximum"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'min': self.min,
+            'max': self.max,
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ('+Inf',), self.counts)},
+        }
+
+class Metrics:
+    """Thread-safe registry of labelled counters and histograms for one process.
+
+    Stage timers also record spans on the Chrome-trace timeline when
+    Config.METRICS_TIMELINE_PATH is set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far and restart the run clock"""
+        with self._lock:
+            self.started = time.perf_counter()
+            self.counters: Dict[Tuple[str, Labels], float] = {}
+            self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+            self.timeline = Timeline() if Config.METRICS_TIMELINE_PATH else None
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(BUCKETS.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time a pipeline stage into the stage_seconds histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.observe('stage_seconds', end - start, stage=stage, **labels)
+            if self.timeline:
+                self.timeline.add(stage, 'stage', start, end, **labels)
+
+    def ingredient_span(self, ingredient_id: int, start: float, status: str, iterations: int = 0):
+        """Record the outcome of one ingredient and its span on the timeline"""
+        self.inc('ingredients_total', status=status)
+        if status != 'failed':
+            self.observe('llm2_iterations', iterations)
+        if self.timeline:
+            self.timeline.add(f"ingredient {ingredient_id}", 'ingredient', start, time.perf_counter(),
+                              pid=INGREDIENTS_PID, tid=ingredient_id, status=status, iterations=iterations)
+
+    def record_ollama(self, model: str, response: Dict[str, Any]):
+        """Record the token counts and timings Ollama reports with every response.
+
+        Streamed responses also carry the client-side time to first token and to
+        completion. A stream stopped early never received Ollama's final chunk, so
+        it is counted separately instead of recording zero tokens.
+        """
+        self.inc('ollama_calls_total', model=model)
+        for field in ('time_to_first_token', 'time_to_complete'):
+            if response.get(field) is not None:
+                self.observe(f'llm_{field}_seconds', response[field], model=model)
+        if response.get('stopped_early'):
+            self.inc('llm_streams_stopped_early_total', model=model)
+            return
+        self.observe('ollama_prompt_tokens', response.get('prompt_eval_count', 0), model=model)
+        self.observe('ollama_generated_tokens', response.get('eval_count', 0), model=model)
+        for field, name in OLLAMA_DURATIONS.items():
+            if response.get(field):
+                self.observe(name, response[field] / 1e9, model=model)
+        if response.get('eval_count') and response.get('eval_duration'):
+            self.observe('ollama_generated_tokens_per_second',
+                         response['eval_count'] / (response['eval_duration'] / 1e9), model=model)
+
+    def _counter(self, name: str, **labels) -> float:
+        return self.counters.get((name, self._labels(labels)), 0)
+
+    def _by_label(self, metrics: Dict, name: str, label: str) -> Dict[str, Any]:
+        return {dict(labels).get(label): value for (metric, labels), value in metrics.items() if metric == name}
+
+    def summary(self) -> Dict[str, Any]:
+        """Snapshot of every counter and histogram with the elapsed wall time"""
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            ingredients = sum(value for (name, _), value in self.counters.items() if name == 'ingredients_total')
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'ingredients_per_second': round(ingredients / elapsed, 3) if elapsed else None,
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        def render_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}' if pairs else ''
+
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{PREFIX}{name}{render_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{name}_bucket{render_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{render_labels(labels)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{render_labels(labels)} {histogram.count}")
+            lines.append(f"# TYPE {PREFIX}elapsed_seconds gauge")
+            lines.append(f"{PREFIX}elapsed_seconds {time.perf_counter() - self.started}")
+        return '\n'.join(lines) + '\n'
+
+    def log_summary(self):
+        """Log where the time went: stages, models, convergence and throughput"""
+        summary = self.summary()
+        logger.info(f"Run summary: {summary['elapsed_seconds']:.1f}s elapsed, "
+                    f"{summary['ingredients_per_second']} ingredients/s")
+        with self._lock:
+            stages = self._by_label(self.histograms, 'stage_seconds', 'stage')
+            for stage, histogram in sorted(stages.items()):
+                logger.info(f"  stage {stage}: {histogram.count} calls, {histogram.sum:.1f}s total, "
+                            f"mean {histogram.sum / histogram.count:.3f}s, p95 {histogram.quantile(0.95):.3f}s")
+            for model, calls in sorted(self._by_label(self.counters, 'ollama_calls_total', 'model').items()):
+                prompt = self.histograms.get(('ollama_prompt_tokens', self._labels({'model': model})))
+                generated = self.histograms.get(('ollama_generated_tokens', self._labels({'model': model})))
+                load = self.histograms.get(('ollama_load_seconds', self._labels({'model': model})))
+                rate = self.histograms.get(('ollama_generated_tokens_per_second', self._labels({'model': model})))
+                logger.info(f"  model {model}: {calls:.0f} calls, {prompt.sum if prompt else 0:.0f} prompt tokens, "
+                            f"{generated.sum if generated else 0:.0f} generated tokens, "
+                            f"{rate.sum / rate.count if rate else 0:.1f} tokens/s, "
+                            f"{load.sum if load else 0:.1f}s loading")
+                first_token = self.histograms.get(('llm_time_to_first_token_seconds', self._labels({'model': model})))
+                if first_token:
+                    complete = self.histograms[('llm_time_to_complete_seconds', self._labels({'model': model}))]
+                    stopped = self._counter('llm_streams_stopped_early_total', model=model)
+                    logger.info(f"  model {model} streaming: time to first token p50 {first_token.quantile(0.5):.3f}s "
+                                f"p95 {first_token.quantile(0.95):.3f}s, time to complete p95 "
+                                f"{complete.quantile(0.95):.3f}s, {stopped:.0f} streams stopped early")
+            tail = {name: self._by_label(self.counters, name, 'model') for name in TAIL_COUNTERS}
+            for model in sorted(set().union(*tail.values())):
+                counts = {name: tail[name].get(model, 0) for name in TAIL_COUNTERS}
+                logger.info(f"  model {model} tail latency: {counts['llm_timeouts_total']:.0f} timeouts, "
+                            f"{counts['llm_retries_total']:.0f} retries, {counts['llm_hedges_total']:.0f} hedges "
+                            f"({counts['llm_hedges_won_total']:.0f} won), circuit opened "
+                            f"{counts['llm_breaker_opened_total']:.0f} times "
+                            f"({counts['llm_breaker_rejections_total']:.0f} requests rejected)")
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if name == 'model_load_seconds':
+                    labels = dict(labels)
+                    logger.info(f"  {labels['reason']} loads of {labels['model']}: {histogram.count} requests, "
+                                f"{histogram.sum:.1f}s total, max {histogram.max:.1f}s")
+            outcomes = self._by_label(self.counters, 'ingredients_total', 'status')
+            if outcomes:
+                logger.info("  ingredients: " + ", ".join(f"{count:.0f} {status}" for status, count in sorted(outcomes.items())))
+            iterations = self.histograms.get(('llm2_iterations', ()))
+            if iterations and iterations.count:
+                logger.info(f"  LLM2 iterations: mean {iterations.sum / iterations.count:.2f}, max {iterations.max}")
+
+    def write(self, path: Optional[str] = None, timeline_path: Optional[str] = None):
+        """Write the metrics file (JSON for .json paths, Prometheus text otherwise) and the timeline"""
+        path = path or Config.METRICS_PATH
+        timeline_path = timeline_path or Config.METRICS_TIMELINE_PATH
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'w') as f:
+                if path.endswith('.json'):
+                    json.dump(self.summary(), f, indent=2)
+                else:
+                    f.write(self.to_prometheus())
+            logger.info(f"Metrics written to {path}")
+        if timeline_path and self.timeline:
+            self.timeline.write(timeline_path)
+            logger.info(f"Timeline written to {timeline_path}")
+
+    def report(self):
+        """Log the end-of-run summary and write the configured metrics files"""
+        try:
+            self.log_summary()
+            self.write()
+        except Exception as e:
+            logger.error(f"Failed to report metrics: {e}")
+
+# Process-wide registry shared by the database, LLM and processor modules
+metrics = Metrics()
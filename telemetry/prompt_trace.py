@@ -0,0 +1,123 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Trace outcomes; everything but OK is a failure and is always kept when TRACE_FAILURES is set
+OK = 'ok'
+EMPTY = 'empty'
+ERROR = 'error'
+INVALID = 'invalid'
+
+class GzipJsonlHandler(logging.Handler):
+    """Appends each record's message (a JSON document) as one line of a gzip-compressed file"""
+
+    def __init__(self, path: str, flush_every: int = 100):
+        super().__init__()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Each run appends a new gzip member; gzip readers concatenate them transparently
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self.flush_every = flush_every
+        self._unflushed = 0
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._file.write(record.getMessage() + '\n')
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self._file.flush()
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        super().close()
+
+class PromptTrace:
+    """Sampled store of full prompts and responses, written on a background thread.
+
+    Records go through a QueueHandler to a QueueListener that compresses them
+    into TRACE_PATH, so model calls never wait on disk I/O. Failures are always
+    kept (when TRACE_FAILURES is set) and successes with probability TRACE_SAMPLE_RATE.
+    """
+
+    def __init__(self, path: Optional[str] = None, sample_rate: Optional[float] = None,
+                 keep_failures: Optional[bool] = None):
+        self.path = Config.TRACE_PATH if path is None else path
+        self.sample_rate = Config.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.keep_failures = Config.TRACE_FAILURES if keep_failures is None else keep_failures
+        self.recorded = 0
+        self._logger = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> logging.Logger:
+        with self._lock:
+            if self._logger is None:
+                records = queue.Queue(-1)
+                self._listener = QueueListener(records, GzipJsonlHandler(self.path))
+                self._listener.start()
+                self._logger = logging.getLogger(f"{__name__}.records")
+                self._logger.propagate = False
+                self._logger.setLevel(logging.INFO)
+                self._logger.addHandler(QueueHandler(records))
+                atexit.register(self.close)
+                logger.info(f"Tracing prompts to {self.path} (failures: {self.keep_failures}, "
+                            f"successes sampled at {self.sample_rate:.2%})")
+            return self._logger
+
+    def sampled(self, status: str) -> bool:
+        """Decide whether a call with this outcome is kept"""
+        if not self.path:
+            return False
+        if status != OK:
+            return self.keep_failures
+        return random.random() < self.sample_rate
+
+    def record(self, model: str, status: str, prompt: Optional[str] = None, response: Optional[str] = None,
+               ingredient_ids: Optional[List[int]] = None, **fields: Any):
+        """Queue a trace record if the sampling policy keeps it"""
+        if not self.sampled(status):
+            return
+        entry: Dict[str, Any] = {
+            'time': time.time(),
+            'model': model,
+            'status': status,
+            'ingredient_ids': ingredient_ids,
+            'prompt': prompt,
+            'response': response,
+        }
+        entry.update(fields)
+        self._start().info(json.dumps(entry, ensure_ascii=False, default=str))
+        self.recorded += 1
+
+    def close(self):
+        """Drain the queue and close the trace file"""
+        with self._lock:
+            if self._listener:
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+                self._logger.handlers.clear()
+                self._listener = None
+                self._logger = None
+
+# Process-wide trace store shared by every OllamaClient
+prompt_trace = PromptTrace()
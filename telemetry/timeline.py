@@ -0,0 +1,46 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+# Chrome trace process ids: pipeline stages are laid out per thread, ingredients one lane each
+STAGES_PID = 1
+INGREDIENTS_PID = 2
+
+class Timeline:
+    """Collects spans in the Chrome trace event format (chrome://tracing, Perfetto)"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._events: List[Dict[str, Any]] = [
+            {'name': 'process_name', 'ph': 'M', 'pid': STAGES_PID, 'args': {'name': 'stages'}},
+            {'name': 'process_name', 'ph': 'M', 'pid': INGREDIENTS_PID, 'args': {'name': 'ingredients'}},
+        ]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, category: str, start: float, end: float,
+            pid: int = STAGES_PID, tid: int = None, **args):
+        """Record a span between two time.perf_counter() readings"""
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self.origin) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': pid,
+            'tid': threading.get_ident() if tid is None else tid,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    def write(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            events = list(self._events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
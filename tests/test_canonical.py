@@ -0,0 +1,27 @@
+import pytest
+from models import Ingredient
+from processor.canonical import canonical_key, canonical_text
+
+@pytest.mark.parametrize("plural, singular", [
+    ("pies", "pie"),
+    ("cookies", "cookie"),
+    ("brownies", "brownie"),
+    ("berries", "berry"),
+    ("strawberries", "strawberry"),
+    ("fries", "fry"),
+    ("tomatoes", "tomato"),
+    ("peaches", "peach"),
+    ("apples", "apple"),
+    ("hummus", "hummus"),
+])
+def test_plural_matches_singular(plural, singular):
+    assert canonical_text(plural) == canonical_text(singular)
+
+def test_short_words_are_kept():
+    assert canonical_text("pie") == "pie"
+    assert canonical_text("egg") == "egg"
+
+def test_key_ignores_case_accents_punctuation_and_plurals():
+    a = Ingredient(id=1, name="  Crème-Brûlée PIES ", category="Desserts")
+    b = Ingredient(id=2, name="creme brulee pie", category="dessert")
+    assert canonical_key(a) == canonical_key(b)